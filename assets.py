@@ -0,0 +1,269 @@
+import io
+import os
+import queue
+import threading
+import time
+import wave
+from collections import OrderedDict
+import pygame as pg
+
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))  # 画像ファイルの相対パスの基準
+
+
+class AssetRegistry:
+    """
+    画像ファイルを1回だけ読み込み，画面のピクセル形式に変換してキャッシュするクラス
+    回転・拡大縮小・反転した画像も操作の列ごとにキャッシュする
+    任意の角度の回転はrotatedで角度をstep度刻みに丸めるので，キャッシュされる回転画像は有限個に収まる
+    musou_kokaton.pyとfight_kokaton.pyで共有する
+    """
+    def __init__(self, step: int = 5):
+        """
+        引数 step：rotatedで丸める角度の刻み（度）
+        """
+        self.cache: dict[tuple, pg.Surface] = {}  # (ファイル名, 変換形式, 操作の列) -> Surface
+        self.raw: dict[str, pg.Surface] = {}  # Preloaderがデコード済みでまだ変換していない画像
+        self.step = step
+        self.hits = 0  # キャッシュから返した回数
+        self.misses = 0  # 読み込み・変換した回数
+        self.rotozooms = 0  # rotozoomを実行した回数
+
+    def _mode(self) -> str:
+        """
+        画面が生成済みならピクセル形式を変換できるので"display"，そうでなければ"raw"を返す
+        """
+        return "display" if pg.display.get_surface() is not None else "raw"
+
+    def _load(self, path: str) -> pg.Surface:
+        """
+        画像ファイルを読み込み，画面が生成済みなら画面のピクセル形式に変換する
+        引数 path：画像ファイルのパス（相対パスはこのファイルのあるディレクトリ基準）
+        戻り値：画像Surface
+        """
+        img = self.raw.pop(path, None)
+        if img is None:
+            img = pg.image.load(os.path.join(BASE_DIR, path))
+        if self._mode() == "raw":
+            return img
+        if img.get_flags() & pg.SRCALPHA or img.get_alpha() is not None or img.get_colorkey() is not None:
+            return img.convert_alpha()  # 透明部分のあるpngやgif（カラーキーも透明度に変換して回転後も残す）
+        return img.convert()  # jpgなど不透明な画像
+
+    def _apply(self, img: pg.Surface, op: tuple) -> pg.Surface:
+        """
+        画像に1つの操作を適用する
+        引数1 img：元の画像Surface
+        引数2 op：("rotozoom", 角度, 倍率)，("flip", 横, 縦)，("scale", 幅, 高さ)のいずれか
+        戻り値：操作後の画像Surface
+        """
+        name, *args = op
+        if name == "rotozoom":
+            self.rotozooms += 1
+            return pg.transform.rotozoom(img, *args)
+        if name == "flip":
+            return pg.transform.flip(img, *args)
+        if name == "scale":
+            return pg.transform.scale(img, args)
+        raise ValueError(f"不明な画像操作: {name}")
+
+    def image(self, path: str, *ops: tuple) -> pg.Surface:
+        """
+        画像ファイルを読み込み，opsの操作を順に適用した画像を返す（2回目以降はキャッシュから返す）
+        引数1 path：画像ファイルのパス
+        引数2以降 ops：適用する操作のタプル（_applyを参照）
+        戻り値：画像Surface（共有されるので書き換えないこと）
+        """
+        key = (path, self._mode(), ops)
+        img = self.cache.get(key)
+        if img is not None:
+            self.hits += 1
+            return img
+        self.misses += 1
+        if ops:
+            img = self._apply(self.image(path, *ops[:-1]), ops[-1])
+        else:
+            img = self._load(path)
+        self.cache[key] = img
+        return img
+
+    def rotated(self, path: str, angle: float, scale: float = 1.0, *ops: tuple) -> pg.Surface:
+        """
+        画像ファイルにopsの操作を適用してから，angle度をstep度刻みに丸めて回転・scale倍に拡大縮小した画像を返す
+        引数1 path：画像ファイルのパス
+        引数2 angle：回転角度（度，反時計回り）
+        引数3 scale：倍率
+        引数4以降 ops：回転の前に適用する操作のタプル
+        戻り値：画像Surface（共有されるので書き換えないこと）
+        """
+        angle = round(angle/self.step)*self.step % 360
+        return self.image(path, *ops, ("rotozoom", angle, scale))
+
+    def stats(self) -> dict:
+        """
+        キャッシュの利用状況を返す
+        戻り値：ヒット数・ミス数・キャッシュ数・保持しているピクセルのバイト数・rotozoomの実行回数と回転画像の数の辞書
+        """
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "entries": len(self.cache),
+            "bytes": sum(img.get_pitch()*img.get_height() for img in self.cache.values()),
+            "rotozooms": self.rotozooms,
+            "rotations": sum(1 for _, _, ops in self.cache if ops and ops[-1][0] == "rotozoom"),
+        }
+
+    def clear(self):
+        """
+        キャッシュと統計を空にする
+        """
+        self.cache.clear()
+        self.raw.clear()
+        self.hits = 0
+        self.misses = 0
+        self.rotozooms = 0
+
+
+class TextCache:
+    """
+    font.renderで描画した文字列Surfaceを(フォント, 文字列, アンチエイリアス, 色)ごとにキャッシュするクラス
+    表示内容が変わらない間は描画し直さない．古いものから捨てる（LRU）ので保持数は一定以下に収まる
+    """
+    def __init__(self, maxsize: int = 64):
+        """
+        引数 maxsize：保持する文字列Surfaceの最大数
+        """
+        self.maxsize = maxsize
+        self.cache: OrderedDict[tuple, pg.Surface] = OrderedDict()
+        self.hits = 0  # キャッシュから返した回数
+        self.misses = 0  # font.renderで描画した回数
+
+    def render(self, font: pg.font.Font, text: str, antialias: bool, color: tuple[int, int, int]) -> pg.Surface:
+        """
+        font.render(text, antialias, color)と同じ文字列Surfaceを返す（同じ引数なら2回目以降はキャッシュから返す）
+        引数1 font：フォント
+        引数2 text：文字列
+        引数3 antialias：アンチエイリアスの有無
+        引数4 color：文字の色タプル
+        戻り値：文字列Surface（共有されるので書き換えないこと）
+        """
+        key = (font, text, bool(antialias), tuple(color))
+        img = self.cache.get(key)
+        if img is not None:
+            self.hits += 1
+            self.cache.move_to_end(key)
+            return img
+        self.misses += 1
+        img = font.render(text, antialias, color)
+        self.cache[key] = img
+        if len(self.cache) > self.maxsize:
+            self.cache.popitem(last=False)
+        return img
+
+    def stats(self) -> dict:
+        """
+        キャッシュの利用状況を返す
+        戻り値：ヒット数・ミス数・キャッシュ数の辞書
+        """
+        return {"hits": self.hits, "misses": self.misses, "entries": len(self.cache)}
+
+    def clear(self):
+        """
+        キャッシュと統計を空にする
+        """
+        self.cache.clear()
+        self.hits = 0
+        self.misses = 0
+
+
+class Preloader:
+    """
+    画像ファイルのデコードと音声ファイルの読み込みをワーカースレッドで行うクラス
+    画面のピクセル形式への変換や回転画像の生成などはメインスレッドでpollを呼ぶたびに少しずつ行うので，
+    その間もロード画面を描画できる
+    """
+    def __init__(self, images: list[str], sounds: list[str] = (), tasks: list = (), reg: AssetRegistry | None = None):
+        """
+        引数1 images：読み込む画像ファイルのパスのリスト
+        引数2 sounds：読み込むWAVファイルのパスのリスト
+        引数3 tasks：全ファイルの読み込み後にメインスレッドで1つずつ呼ぶ関数のリスト（回転画像の生成など）
+        引数4 reg：デコードした画像を渡すAssetRegistry（Noneならregistry）
+        """
+        self.images = list(images)
+        self.sounds_todo = list(sounds)
+        self.tasks = list(tasks)
+        self.registry = reg if reg is not None else registry
+        self.sounds: dict[str, tuple] = {}  # パス -> (WAVのヘッダ, ファイルの中身)
+        self.total = len(self.images)+len(self.sounds_todo)+len(self.tasks)
+        self.done = 0
+        self.queue: queue.Queue = queue.Queue()
+        self.thread = threading.Thread(target=self._run, name="preloader", daemon=True)
+
+    def start(self) -> "Preloader":
+        """
+        ワーカースレッドで読み込みを始める
+        戻り値：自身
+        """
+        self.thread.start()
+        return self
+
+    def _run(self):
+        """
+        ワーカースレッドの処理：画像をデコードし，WAVのヘッダと中身を読み込んでキューに入れる
+        """
+        for path in self.images:
+            try:
+                self.queue.put(("image", path, pg.image.load(os.path.join(BASE_DIR, path))))
+            except Exception as e:
+                self.queue.put(("error", path, e))
+        for path in self.sounds_todo:
+            try:
+                with open(os.path.join(BASE_DIR, path), "rb") as f:
+                    data = io.BytesIO(f.read())
+                with wave.open(data, "rb") as w:
+                    params = w.getparams()
+                data.seek(0)
+                self.queue.put(("sound", path, (params, data)))
+            except Exception as e:
+                self.queue.put(("error", path, e))
+
+    def poll(self, budget: float = 0.008) -> bool:
+        """
+        読み込み済みのファイルを変換し，全ファイルが揃っていればtasksを実行する（budget秒を超えたら次回に回す）
+        メインスレッドから毎フレーム呼ぶ
+        引数 budget：1回の呼び出しで使う時間の目安（秒）
+        戻り値：全て準備できたか
+        """
+        limit = time.perf_counter()+budget
+        while not self.ready and time.perf_counter() < limit:
+            if self.done < len(self.images)+len(self.sounds_todo):
+                try:
+                    kind, path, item = self.queue.get(timeout=max(0.0, limit-time.perf_counter()))
+                except queue.Empty:
+                    break
+                if kind == "error":
+                    raise item
+                if kind == "image":
+                    self.registry.raw[path] = item
+                    self.registry.image(path)  # 画面のピクセル形式に変換してキャッシュする
+                else:
+                    self.sounds[path] = item
+            else:
+                self.tasks[self.done-len(self.images)-len(self.sounds_todo)]()
+            self.done += 1
+        return self.ready
+
+    @property
+    def ready(self) -> bool:
+        return self.done == self.total
+
+    @property
+    def progress(self) -> float:
+        """
+        準備できた割合（0～1）
+        """
+        return self.done/self.total if self.total else 1.0
+
+
+registry = AssetRegistry()
+texts = TextCache()
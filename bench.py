@@ -0,0 +1,525 @@
+import argparse
+import itertools
+import json
+import os
+import platform
+import random
+import sys
+import time
+import numpy as np
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")  # pygameの挨拶文を比較表や結果の出力に混ぜない
+import pygame as pg
+
+import fight_kokaton as fight
+import musou_kokaton as game
+from scheduler import Scheduler
+from simulate import RandomBot
+
+
+SUITE: dict[str, tuple[str, object]] = {}  # ベンチマーク名 -> (種類, 準備関数)
+KINDS = ("micro", "render", "macro")  # ベンチマークの種類
+COUNTS = (100, 1000, 10000)  # 描画・マクロベンチマークの爆弾数
+PHASE_TMR = {1: 2000, 2: 6000}  # 攻撃形態ごとに固定するtmr
+
+
+def register(kind: str, name: str):
+    """
+    ベンチマークの準備関数をSUITEに登録するデコレータ
+    準備関数は画面Surfaceを受け取り，計測する引数なしの関数を返す
+    引数1 kind：種類（KINDSのどれか）
+    引数2 name：ベンチマーク名
+    """
+    def deco(setup):
+        SUITE[name] = (kind, setup)
+        return setup
+    return deco
+
+
+def stats(samples: list[float]) -> dict:
+    """
+    所要時間の標本の統計を返す
+    引数 samples：所要時間（ミリ秒）のリスト
+    戻り値：最小・中央値・p99・平均（ミリ秒）と標本数の辞書
+    """
+    samples = sorted(samples)
+    n = len(samples)
+    return {
+        "min": samples[0],
+        "median": samples[n//2],
+        "p99": samples[min(n-1, int(0.99*n))],
+        "mean": sum(samples)/n,
+        "n": n,
+    }
+
+
+def timeit(func, repeat: int = 20) -> dict:
+    """
+    funcをrepeat回呼んだ所要時間の統計を返す
+    引数1 func：引数なしの関数
+    引数2 repeat：呼ぶ回数
+    戻り値：statsの辞書
+    """
+    func()  # 初回のキャッシュ作成などを除く
+    samples = []
+    for _ in range(repeat):
+        t = time.perf_counter()
+        func()
+        samples.append(1000*(time.perf_counter()-t))
+    return stats(samples)
+
+
+def random_bullets(n: int, seed: int = 0) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    画面内に散らばったn個の爆弾の中心座標・半径・色を作る
+    """
+    rng = np.random.default_rng(seed)
+    pos = rng.uniform((0, 0), (game.WIDTH, game.HEIGHT), (n, 2))
+    rad = rng.integers(5, 14, n)
+    color = rng.integers(0, len(game.Bomb.colors), n)
+    return pos, rad, color
+
+
+def stopped_enemy(tmr: int) -> game.Enemy:
+    """
+    停止位置まで降下し終えた敵機を作る
+    """
+    emy = game.Enemy(tmr)
+    for _ in range(emy.descent()):
+        emy.update()
+    emy.stop()
+    return emy
+
+
+def random_bombs(n: int, tmr: int, seed: int = 0) -> game.BombGroup:
+    """
+    画面内に散らばったn個のBombを持つBombGroupを作る
+    """
+    game.rng.seed(seed)
+    emy, bird = stopped_enemy(tmr), game.Bird(3, (300, 550))
+    group = game.BombGroup()
+    for x, y in random_bullets(n, seed)[0].tolist():
+        bomb = game.Bomb(emy, bird, tmr)
+        bomb.rect.center = x, y
+        group.add(bomb)
+    return group
+
+
+# ---- マイクロベンチマーク：関数・メソッド単体 ----
+
+@register("micro", "check_bound x1000")
+def _(screen):
+    rects = [pg.Rect(x, y, 20, 20) for x, y in random_bullets(1000)[0].tolist()]
+    return lambda: [game.check_bound(r) for r in rects]
+
+
+@register("micro", "calc_orientation x1000")
+def _(screen):
+    org = pg.Rect(280, 80, 40, 40)
+    rects = [pg.Rect(x, y, 20, 20) for x, y in random_bullets(1000)[0].tolist()]
+    return lambda: [game.calc_orientation(org, r) for r in rects]
+
+
+for _phase, _tmr in PHASE_TMR.items():
+    @register("micro", f"Bomb.__init__ phase{_phase} x100")
+    def _(screen, tmr=_tmr):
+        game.rng.seed(0)
+        emy, bird = stopped_enemy(tmr), game.Bird(3, (300, 550))
+        return lambda: [game.Bomb(emy, bird, tmr) for _ in range(100)]
+
+    @register("micro", f"Bomb.update phase{_phase} x1000")
+    def _(screen, tmr=_tmr):
+        group = random_bombs(1000, tmr)
+        sprites = group.sprites()
+        state = [(b.rect.center, b.vx, b.vy, b.life, b.bounces) for b in sprites]
+
+        def run():
+            for b, (xy, vx, vy, life, bounces) in zip(sprites, state):  # 画面端で消えた・反射した爆弾を元に戻す
+                b.rect.center, b.vx, b.vy, b.life, b.bounces, b.expired = xy, vx, vy, life, bounces, False
+            group.add(sprites)
+            group.update(tmr)
+            game.Bomb.pool.clear()  # 消えた爆弾は次の計測で使い直すので，再利用に回さない
+        return run
+
+
+@register("micro", "Enemy.volley phase1 x10")
+def _(screen):
+    game.rng.seed(0)
+    emy, bird = stopped_enemy(0), game.Bird(3, (300, 550))
+    return lambda: [emy.volley(bird, PHASE_TMR[1]) for _ in range(10)]
+
+
+@register("micro", "spritecollide 1000 bombs")
+def _(screen):
+    group, bird = random_bombs(1000, PHASE_TMR[2]), game.Bird(3, (300, 550))
+    return lambda: pg.sprite.spritecollide(bird, group, False)
+
+
+@register("micro", "SpatialHash.spritecollide 1000 bombs")
+def _(screen):
+    group, bird = random_bombs(1000, PHASE_TMR[2]), game.Bird(3, (300, 550))
+    return lambda: group.hash.spritecollide(bird, False)
+
+
+@register("micro", "groupcollide 1000 bombs")
+def _(screen):
+    group, gras = random_bombs(1000, PHASE_TMR[2]), pg.sprite.Group(game.hissatu(50))
+    return lambda: pg.sprite.groupcollide(group, gras, False, False)
+
+
+@register("micro", "SpatialHash.groupcollide 1000 bombs")
+def _(screen):
+    group, gras = random_bombs(1000, PHASE_TMR[2]), pg.sprite.Group(game.hissatu(50))
+    return lambda: group.hash.groupcollide(gras, False)
+
+
+for _n in (10, 1000):
+    @register("micro", f"poll {_n} emitters")
+    def _(screen, n=_n):
+        """
+        以前のmainのように毎ティック全敵機の爆弾投下インターバルを調べる
+        """
+        intervals = [random.Random(i).randint(40, 45) for i in range(n)]
+        tick = iter(range(10**9))
+
+        def run():
+            tmr = next(tick)
+            return [i for i in intervals if tmr%i == 0]
+        return run
+
+    @register("micro", f"Scheduler.run {_n} emitters")
+    def _(screen, n=_n):
+        """
+        爆弾投下を予定しておき，期限が来たものだけ呼ぶ
+        """
+        sched = Scheduler()
+        for i in range(n):
+            interval = random.Random(i).randint(40, 45)
+            sched.at(interval, int, every=interval)
+        tick = iter(range(1, 10**9))
+        return lambda: sched.run(next(tick), "spawn")
+
+
+@register("micro", "Score.update+Time.update")
+def _(screen):
+    score, get_time = game.Score(), game.Time()
+
+    def run():
+        score.update(screen)
+        get_time.update(screen)
+    return run
+
+
+@register("micro", "Time.update new value")
+def _(screen):
+    get_time = game.Time()
+
+    def run():
+        get_time.value -= 1  # 1秒ごとに表示が変わるときの描画し直し
+        get_time.update(screen)
+    return run
+
+
+@register("micro", "fight.check_bound x1000")
+def _(screen):
+    rects = [pg.Rect(x, y, 20, 20) for x, y in random_bullets(1000)[0].tolist()]
+    return lambda: [fight.check_bound(r) for r in rects]
+
+
+@register("micro", "fight.Bomb.update x100")
+def _(screen):
+    random.seed(0)
+    bombs = [fight.Bomb((255, 0, 0), 10) for _ in range(100)]
+    return lambda: [b.update(screen) for b in bombs]
+
+
+@register("micro", "fight.Score.update")
+def _(screen):
+    score = fight.Score(0, "hgp創英角ﾎﾟｯﾌﾟ体", (0, 0, 255))
+    point = iter(range(10**9))
+    return lambda: score.update(screen, next(point)//10)
+
+
+# ---- 描画ベンチマーク：爆弾の描画方法の比較 ----
+
+def sprite_group(pos: np.ndarray, rad: np.ndarray, color: np.ndarray) -> pg.sprite.Group:
+    """
+    位置を決めた爆弾円SpriteのGroupを作る
+    """
+    group = pg.sprite.Group()
+    for (x, y), r, c in zip(pos.tolist(), rad.tolist(), color.tolist()):
+        spr = pg.sprite.Sprite()
+        spr.image = game.Bomb.circle(game.Bomb.colors[c], r)
+        spr.rect = spr.image.get_rect(center=(x, y))
+        group.add(spr)
+    return group
+
+
+for _n in COUNTS:
+    @register("render", f"group {_n}")
+    def _(screen, n=_n):
+        """
+        位置を決めてあるSpriteをGroup.drawで描画する（--engine spriteの描画）
+        """
+        group = sprite_group(*random_bullets(n))
+        return lambda: group.draw(screen)
+
+    @register("render", f"group_sync {_n}")
+    def _(screen, n=_n):
+        """
+        配列の中心座標をSpriteのrectに書き写してからGroup.drawで描画する
+        """
+        pos = random_bullets(n)[0]
+        group = sprite_group(*random_bullets(n))
+        sprites = group.sprites()
+
+        def run():
+            for spr, xy in zip(sprites, pos.tolist()):
+                spr.rect.center = xy
+            group.draw(screen)
+        return run
+
+    @register("render", f"blits {_n}")
+    def _(screen, n=_n):
+        """
+        爆弾ごとに爆弾円Surfaceを探して1回のblitsで描画する（以前のBullets.draw）
+        """
+        pos, rad, color = random_bullets(n)
+        colors = game.Bomb.colors
+        return lambda: screen.blits([(game.Bomb.circle(colors[c], r), (x-r, y-r))
+                                     for (x, y), r, c in zip(pos.tolist(), rad.tolist(), color.tolist())])
+
+    @register("render", f"batched {_n}")
+    def _(screen, n=_n):
+        """
+        blit_bullets（BATCH_MIN個以上は(色, 半径)ごとにまとめて1組1回，少なければ配列の順に1回のblitsで描画する）
+        """
+        pos, rad, color = random_bullets(n)
+        return lambda: game.blit_bullets(screen, pos, rad, color)
+
+    @register("render", f"batched_norect {_n}")
+    def _(screen, n=_n):
+        """
+        batchedで描画した矩形を作らない（画面全体を描き直すとき）
+        """
+        pos, rad, color = random_bullets(n)
+        return lambda: game.blit_bullets(screen, pos, rad, color, False)
+
+
+# ---- マクロベンチマーク：1ティック全体・1ゲーム全体 ----
+
+def fill(bombs, n: int, tmr: int, emy: game.Enemy, bird: game.Bird, rng: np.random.Generator):
+    """
+    爆弾がn個になるまで，画面内のランダムな位置からランダムな方向に進む爆弾を足す
+    引数1 bombs：BulletsまたはBombGroup
+    引数2 n：保つ爆弾の数
+    引数3 tmr：攻撃形態を決める経過ティック
+    引数4 emy：爆弾を投下する敵機
+    引数5 bird：攻撃対象のこうかとん
+    引数6 rng：位置と方向を決める乱数生成器
+    """
+    k = n-len(bombs)
+    if k <= 0:
+        return
+    pos = rng.uniform((20, 20), (game.WIDTH-20, game.HEIGHT-20), (k, 2))
+    angle = rng.uniform(0, 2*np.pi, k)
+    vel = np.stack([np.cos(angle), np.sin(angle)], axis=1)
+    if isinstance(bombs, game.Bullets):
+        phase = game.phase_at(tmr)
+        lo, hi = phase["rad"]
+        args = (pos, vel, np.full(k, float(phase["speed"])), rng.integers(lo, hi+1, k),
+                rng.integers(0, len(game.Bomb.colors), k))
+        if bombs.linear is not None and game.is_linear(phase):
+            bombs.linear.add(*args, tmr)
+        else:
+            bombs.add(*args, *game.limits(phase))
+        return
+    for (x, y), d in zip(pos.tolist(), vel.tolist()):
+        bomb = game.Bomb.spawn(emy, bird, tmr, bullet=d)
+        bomb.vx, bomb.vy = d
+        bomb.rect.center = x, y
+        bombs.add(bomb)
+
+
+for _phase, _tmr in PHASE_TMR.items():
+    for _engine in ("array", "lazy", "sprite"):
+        for _n in COUNTS:
+            @register("macro", f"phase{_phase} {_engine} {_n} bullets")
+            def _(screen, start=_tmr, engine=_engine, n=_n):
+                """
+                爆弾数をnに保ったまま，補充・当たり判定・移動・描画の1ティックを計測する（mainと同じ順）
+                """
+                game.rng.seed(0)
+                game.Bomb.pool.clear()  # 先に実行したベンチマークの爆弾を再利用しない
+                rng = np.random.default_rng(0)
+                emy, bird = stopped_enemy(start), game.Bird(3, (300, 550))
+                if engine == "sprite":
+                    bombs = game.BombGroup()
+                else:
+                    bombs = game.Bullets(0, lazy=engine == "lazy")
+                bg_img = game.registry.image("fig/bg_boss.jpg")
+                clock = itertools.count(start)
+
+                def tick():
+                    tmr = next(clock)
+                    fill(bombs, n, tmr, emy, bird, rng)
+                    if engine == "sprite":
+                        bombs.hash.circlecollide(bird.rect.center, 6, True)
+                    else:
+                        bombs.collide_circle(bird.rect.center, 6)
+                    bombs.update(tmr)
+                    screen.blit(bg_img, (0, 0))
+                    if engine == "sprite":
+                        game.draw_group(bombs, screen)
+                    else:
+                        bombs.draw(screen, 1.0, False)
+                    pg.display.update()
+                return tick
+
+
+class TickTimer:
+    """
+    ボットとしてmainに渡し，呼ばれる間隔（ヘッドレスでは1フレームの所要時間）を攻撃形態ごとに記録するクラス
+    """
+    def __init__(self, bot):
+        """
+        引数 bot：入力を決める元のボット
+        """
+        self.bot = bot
+        self.last = None
+        self.samples: dict[str, list[float]] = {}  # 攻撃形態名 -> 1フレームの所要時間（ミリ秒）のリスト
+
+    def __call__(self, bird, bombs, tmr: int) -> int:
+        now = time.perf_counter()
+        if self.last is not None:
+            phase = game.phase_at(tmr-1)
+            self.samples.setdefault(phase["name"] if phase else "end", []).append(1000*(now-self.last))
+        self.last = now
+        return self.bot(bird, bombs, tmr)
+
+
+def run_game(engine: str, seed: int = 0, sim: str = "inline") -> dict:
+    """
+    ランダムに動くボットで無敵の1ゲームを最後までヘッドレスで遊ぶ
+    引数1 engine：爆弾の管理方法
+    引数2 seed：乱数シード
+    引数3 sim：シミュレーションの進め方（"inline"または"thread"）
+    戻り値：攻撃形態名 -> 1フレームの所要時間のstatsの辞書
+    """
+    timer = TickTimer(RandomBot(seed))
+    game.main(headless=True, seed=seed, invincible=True, engine=engine, bot=timer, sim=sim)
+    return {name: stats(samples) for name, samples in timer.samples.items()}
+
+
+# ---- 実行・保存・比較 ----
+
+def meta() -> dict:
+    """
+    計測環境の情報を返す
+    """
+    return {
+        "python": platform.python_version(),
+        "pygame": pg.version.ver,
+        "numpy": np.__version__,
+        "machine": platform.machine(),
+        "platform": platform.platform(),
+        "time": time.strftime("%Y-%m-%d %H:%M:%S"),
+    }
+
+
+def run(kinds: list[str], keyword: str | None = None, repeat: int = 50, ticks: int = 100,
+        games: bool = True) -> dict:
+    """
+    SDLダミードライバの画面でベンチマークを実行する
+    引数1 kinds：実行する種類のリスト
+    引数2 keyword：名前にこの文字列を含むものだけ実行する（Noneなら全部）
+    引数3 repeat：マイクロ・描画ベンチマークを計測する回数
+    引数4 ticks：マクロベンチマークで計測するティック数
+    引数5 games：Trueなら1ゲームを最後まで遊ぶマクロベンチマークも実行する
+    戻り値：ベンチマーク名 -> statsの辞書
+    """
+    pg.init()
+    screen = pg.display.set_mode((game.WIDTH, game.HEIGHT))
+    game.Bomb.prerender()
+    results = {}
+    for name, (kind, setup) in SUITE.items():
+        if kind in kinds and (keyword is None or keyword in name):
+            results[name] = timeit(setup(screen), ticks if kind == "macro" else repeat)
+            print(f"{name:40s} {results[name]['median']:9.3f} ms", file=sys.stderr)
+    if games and "macro" in kinds:
+        for engine, sim in (("array", "inline"), ("lazy", "inline"), ("sprite", "inline"), ("array", "thread")):
+            label = engine if sim == "inline" else f"{engine} {sim}"
+            if keyword is not None and keyword not in f"game {label}":
+                continue
+            for phase, st in run_game(engine, sim=sim).items():
+                name = f"game {label} {phase}"
+                results[name] = st
+                print(f"{name:40s} {st['median']:9.3f} ms", file=sys.stderr)
+    pg.quit()
+    return results
+
+
+def compare(results: dict, baseline: dict, threshold: float, min_delta: float = 0.01, out=sys.stdout) -> list[str]:
+    """
+    基準の結果と中央値を比べて表示する
+    引数1 results：今回の結果（ベンチマーク名 -> stats）
+    引数2 baseline：基準の結果（ベンチマーク名 -> stats）
+    引数3 threshold：退行とみなす中央値の悪化の割合（0.1なら10%遅くなったら退行）
+    引数4 min_delta：悪化がこのミリ秒未満なら計測の揺れとみなして退行にしない
+    引数5 out：表示先
+    戻り値：退行したベンチマーク名のリスト
+    """
+    regressions = []
+    for name, st in results.items():
+        base = baseline.get(name)
+        if base is None:
+            print(f"{name:40s} {'-':>9s} -> {st['median']:9.3f} ms  (基準なし)", file=out)
+            continue
+        ratio = st["median"]/base["median"] if base["median"] > 0 else float("inf")
+        mark = ""
+        if ratio > 1+threshold and st["median"]-base["median"] >= min_delta:
+            mark = "REGRESSION"
+            regressions.append(name)
+        elif ratio < 1/(1+threshold):
+            mark = "faster"
+        print(f"{name:40s} {base['median']:9.3f} -> {st['median']:9.3f} ms  x{ratio:5.2f} {mark}", file=out)
+    return regressions
+
+
+def main(argv: list[str] | None = None) -> int:
+    """
+    ベンチマークを実行し，結果を基準として保存したり基準と比べたりする
+    引数 argv：コマンドライン引数（Noneならsys.argv）
+    戻り値：終了コード（基準と比べて退行があれば1）
+    """
+    parser = argparse.ArgumentParser(description="死ぬなこうかとん‼・たたかえ！こうかとんの処理のベンチマーク")
+    parser.add_argument("--only", nargs="+", choices=KINDS, default=list(KINDS), help="実行する種類")
+    parser.add_argument("-k", dest="keyword", default=None, help="名前にこの文字列を含むベンチマークだけ実行する")
+    parser.add_argument("--repeat", type=int, default=50, help="マイクロ・描画ベンチマークを計測する回数")
+    parser.add_argument("--ticks", type=int, default=100, help="マクロベンチマークで計測するティック数")
+    parser.add_argument("--no-games", action="store_true", help="1ゲームを最後まで遊ぶマクロベンチマークを省く")
+    parser.add_argument("--save", default=None, help="結果を基準として書き出すJSONファイル")
+    parser.add_argument("--compare", default=None, help="比べる基準のJSONファイル")
+    parser.add_argument("--threshold", type=float, default=0.10, help="退行とみなす中央値の悪化の割合")
+    parser.add_argument("--min-delta", type=float, default=0.01, help="退行とみなす中央値の悪化の最小値（ミリ秒）")
+    args = parser.parse_args(argv)
+
+    results = run(args.only, args.keyword, args.repeat, args.ticks, not args.no_games)
+    if args.save is not None:
+        with open(args.save, "w") as f:
+            json.dump({"meta": meta(), "results": results}, f, indent=2)
+    if args.compare is None:
+        for name, st in results.items():
+            print(f"{name:40s} {st['median']:9.3f} ms  (min {st['min']:.3f}, p99 {st['p99']:.3f})")
+        return 0
+    with open(args.compare) as f:
+        baseline = json.load(f)
+    regressions = compare(results, baseline["results"], args.threshold, args.min_delta)
+    print(f"{len(regressions)} regressions (threshold {100*args.threshold:.0f}%)")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,14 +1,14 @@
-import os
 import random
 import sys
 import time
 import pygame as pg
 
+from assets import registry, texts
+
 
 WIDTH = 600  # ゲームウィンドウの幅
 HEIGHT = 700  # ゲームウィンドウの高さ
 NUM_OF_BOMBS = 5  # 爆弾の数を表す定数
-os.chdir(os.path.dirname(os.path.abspath(__file__)))
 
 
 def check_bound(obj_rct: pg.Rect) -> tuple[bool, bool]:
@@ -35,25 +35,37 @@ class Bird:
         pg.K_LEFT: (-5, 0),
         pg.K_RIGHT: (+5, 0),
     }
-    img0 = pg.transform.rotozoom(pg.image.load("fig/3.png"), 0, 0.9)
-    img = pg.transform.flip(img0, True, False)  # デフォルトのこうかとん（右向き）
-    imgs = {  # 0度から反時計回りに定義
-        (+5, 0): img,  # 右
-        (+5, -5): pg.transform.rotozoom(img, 45, 0.9),  # 右上
-        (0, -5): pg.transform.rotozoom(img, 90, 0.9),  # 上
-        (-5, -5): pg.transform.rotozoom(img0, -45, 0.9),  # 左上
-        (-5, 0): img0,  # 左
-        (-5, +5): pg.transform.rotozoom(img0, 45, 0.9),  # 左下
-        (0, +5): pg.transform.rotozoom(img, -90, 0.9),  # 下
-        (+5, +5): pg.transform.rotozoom(img, -45, 0.9),  # 右下
-    }
+    imgs: dict[tuple[int, int], pg.Surface] = {}  # 移動量 -> こうかとん画像（最初のBird生成時に作る）
+
+    @classmethod
+    def load_imgs(cls) -> dict[tuple[int, int], pg.Surface]:
+        """
+        移動方向ごとのこうかとん画像を作る（2回目以降は作らずに返す）
+        戻り値：移動量 -> こうかとん画像の辞書
+        """
+        if cls.imgs:
+            return cls.imgs
+        zoom, flip = ("rotozoom", 0, 0.9), ("flip", True, False)
+        img0 = registry.image("fig/3.png", zoom)
+        img = registry.image("fig/3.png", zoom, flip)  # デフォルトのこうかとん（右向き）
+        cls.imgs.update({  # 0度から反時計回りに定義
+            (+5, 0): img,  # 右
+            (+5, -5): registry.rotated("fig/3.png", 45, 0.9, zoom, flip),  # 右上
+            (0, -5): registry.rotated("fig/3.png", 90, 0.9, zoom, flip),  # 上
+            (-5, -5): registry.rotated("fig/3.png", -45, 0.9, zoom),  # 左上
+            (-5, 0): img0,  # 左
+            (-5, +5): registry.rotated("fig/3.png", 45, 0.9, zoom),  # 左下
+            (0, +5): registry.rotated("fig/3.png", -90, 0.9, zoom, flip),  # 下
+            (+5, +5): registry.rotated("fig/3.png", -45, 0.9, zoom, flip),  # 右下
+        })
+        return cls.imgs
 
     def __init__(self, xy: tuple[int, int]):
         """
         こうかとん画像Surfaceを生成する
         引数 xy：こうかとん画像の初期位置座標タプル
         """
-        self.img = __class__.imgs[(+5, 0)]
+        self.img = __class__.load_imgs()[(+5, 0)]
         self.rct: pg.Rect = self.img.get_rect()
         self.rct.center = xy
 
@@ -63,7 +75,7 @@ class Bird:
         引数1 num：こうかとん画像ファイル名の番号
         引数2 screen：画面Surface
         """
-        self.img = pg.transform.rotozoom(pg.image.load(f"fig/{num}.png"), 0, 0.9)
+        self.img = registry.image(f"fig/{num}.png", ("rotozoom", 0, 0.9))
         screen.blit(self.img, self.rct)
 
     def update(self, key_lst: list[bool], screen: pg.Surface):
@@ -127,7 +139,7 @@ class Score:
         引数3 color: フォントの色(R,G,B)
         """
         self.fonto = pg.font.SysFont(font, 30)
-        self.img = self.fonto.render(f"スコア:{point}", 0, color)
+        self.img = texts.render(self.fonto, f"スコア:{point}", 0, color)
         self.rct = self.img.get_rect() 
         self.rct.center = (100, (HEIGHT-50))
         
@@ -137,14 +149,14 @@ class Score:
         引数1 screen：画面Surface
         引数2 point: スコア変動時の値
         """
-        self.img = self.fonto.render(f"スコア:{point}", 0, (0, 0, 255))
+        self.img = texts.render(self.fonto, f"スコア:{point}", 0, (0, 0, 255))
         screen.blit(self.img, self.rct)
 
 
 def main():
     pg.display.set_caption("たたかえ！こうかとん")
     screen = pg.display.set_mode((WIDTH, HEIGHT))    
-    bg_img = pg.image.load("fig/pg_bg.jpg")
+    bg_img = registry.image("fig/pg_bg.jpg")
     bird = Bird((300, 200))
     bomb = Bomb((255, 0, 0), 10)
     bombs=[Bomb((255, 0, 0), 10) for _ in range(NUM_OF_BOMBS)]
@@ -164,7 +176,7 @@ def main():
                 # ゲームオーバー時に，こうかとん画像を切り替え，1秒間表示させる
                 bird.change_img(8, screen)
                 fonto = pg.font.Font(None, 80)
-                txt = fonto.render("Game Over", True, (255, 0, 0))
+                txt = texts.render(fonto, "Game Over", True, (255, 0, 0))
                 screen.blit(txt, [WIDTH//2-150, HEIGHT//2])
                 pg.display.update()
                 time.sleep(1)
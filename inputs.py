@@ -0,0 +1,115 @@
+import time
+from collections import deque
+import pygame as pg
+
+from replay import BOMB_BIT, KEY_BITS, encode_keys
+
+
+class KeyState:
+    """
+    KEYDOWN/KEYUPイベントから押下キーの状態を入力ビットとして持ち続けるクラス
+    ティックの直前にsampleで最新の状態を読み出し，入力の時刻から画面に表示されるまでの遅延を記録する
+    """
+    def __init__(self, bomb_key: int = pg.K_b, delay: int = 0):
+        """
+        引数1 bomb_key：押すたびに必殺技を1回発動するキー
+        引数2 delay：ティックに反映した入力が画面に表示されるまでに更新する画面の数
+                     （前のフレームを描画する間に次のフレームを進めるなら1）
+        """
+        self.bomb_key = bomb_key
+        self.delay = delay
+        self.bits = 0  # 押下中のキーの入力ビット
+        self.latched = 0  # 前回のsample以降に押されたキーの入力ビット（すぐ離されても1ティックは反映する）
+        self.bombs = 0  # まだ発動していない必殺技のキー押下の数
+        self.events = 0  # 処理したキーのイベント数
+        self.waiting: list[float] = []  # まだティックに反映していない入力の時刻
+        self.applied: list[float] = []  # ティックに反映したが，まだ画面に表示していない入力の時刻
+        self.pending: deque[list[float]] = deque()  # 画面の更新delay回分待っている入力の時刻
+        self.latency: list[float] = []  # 入力から画面の更新までの秒数
+
+    def sync(self, key_lst=None):
+        """
+        押下キーの状態を読み直す（ゲーム開始時やウィンドウが入力を受け取れるようになったとき）
+        引数 key_lst：押下キーの真理値リスト（Noneならpg.key.get_pressed()）
+        """
+        self.bits = encode_keys(pg.key.get_pressed() if key_lst is None else key_lst)
+
+    def handle(self, event: pg.event.Event, now: float | None = None) -> bool:
+        """
+        キーのイベントを押下状態に反映し，入力の時刻を記録する
+        引数1 event：pg.event.get()で取り出したイベント
+        引数2 now：入力の時刻（Noneなら今のperf_counter）
+        戻り値：押下状態に反映したイベントならTrue
+        """
+        if event.type == pg.WINDOWFOCUSLOST:  # 離したキーのKEYUPが届かなくなるので，全て離したことにする
+            self.bits = 0
+            return False
+        if event.type == pg.WINDOWFOCUSGAINED:
+            self.sync()
+            return False
+        if event.type not in (pg.KEYDOWN, pg.KEYUP):
+            return False
+        if event.key == self.bomb_key:
+            if event.type == pg.KEYUP:
+                return False
+            self.bombs += 1
+        elif event.key in KEY_BITS:
+            bit = KEY_BITS[event.key]
+            if event.type == pg.KEYDOWN:
+                self.bits |= bit
+                self.latched |= bit
+            else:
+                self.bits &= ~bit
+        else:
+            return False
+        self.events += 1
+        self.waiting.append(time.perf_counter() if now is None else now)
+        return True
+
+    def sample(self) -> int:
+        """
+        1ティック分の入力ビットを返す（必殺技のキー押下は1ティックに1回ずつ発動する）
+        戻り値：入力ビット
+        """
+        bits = self.bits | self.latched
+        self.latched = 0
+        if self.bombs:
+            self.bombs -= 1
+            bits |= BOMB_BIT
+        self.applied += self.waiting
+        self.waiting.clear()
+        return bits
+
+    def flipped(self, now: float | None = None):
+        """
+        画面を更新したときに呼び，この画面に表示された入力の遅延を記録する
+        引数 now：画面を更新した時刻（Noneなら今のperf_counter）
+        """
+        self.pending.append(self.applied)
+        self.applied = []
+        if len(self.pending) <= self.delay:
+            return
+        shown = self.pending.popleft()
+        if not shown:
+            return
+        now = time.perf_counter() if now is None else now
+        self.latency += [now-t for t in shown]
+
+    def stats(self) -> dict:
+        """
+        入力の遅延の統計を返す
+        戻り値：キーのイベント数と，入力から画面の更新までの遅延（ミリ秒）のp50/p95/p99/最大の辞書
+        """
+        lat = sorted(self.latency)
+        n = len(lat)
+        if n == 0:
+            return {"events": self.events, "samples": 0}
+        pct = lambda q: 1000*lat[min(n-1, int(q*n))]
+        return {
+            "events": self.events,
+            "samples": n,
+            "latency_p50": pct(0.50),
+            "latency_p95": pct(0.95),
+            "latency_p99": pct(0.99),
+            "latency_max": 1000*lat[-1],
+        }
@@ -1,15 +1,32 @@
+import argparse
+import json
 import math
 import os
 import random
 import sys
 import time
-import wave
+from dataclasses import dataclass, replace
+from itertools import repeat
+import numpy as np
+
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")  # 結果のJSONだけを標準出力に出す
 import pygame as pg
 
+from assets import Preloader, registry, texts
+from patterns import NO_LIMIT, PHASES, BulletBudget, PatternEngine, is_linear, limits, phase_at
+from profiler import FrameProfiler
+from quality import QualityGovernor
+from inputs import KeyState
+from replay import BOMB_BIT, Replay, decode_keys
+from pipeline import SimPipeline
+from scheduler import Scheduler
+
 
 WIDTH = 600  # ゲームウィンドウの幅
 HEIGHT =700  # ゲームウィンドウの高さ
-os.chdir(os.path.dirname(os.path.abspath(__file__)))
+TICK_RATE = 50  # シミュレーションの1秒あたりのティック数
+TICK = 1/TICK_RATE  # 1ティックの秒数
+rng = random.Random()  # ゲーム中の乱数はすべてこの生成器から取る（シードを決めれば再現できる）
 
 
 def check_bound(obj_rct: pg.Rect) -> tuple[bool, bool]:
@@ -58,51 +75,97 @@ class Bird(pg.sprite.Sprite):
         引数2 xy：こうかとん画像の位置座標タプル
         """
         super().__init__()
-        img0 = pg.transform.rotozoom(pg.image.load(f"fig/{num}.png"), 0, 0.5)
-        img = pg.transform.flip(img0, True, False)  # デフォルトのこうかとん
+        path, half, flip = f"fig/{num}.png", ("rotozoom", 0, 0.5), ("flip", True, False)
+        img0 = registry.image(path, half)
+        img = registry.image(path, half, flip)  # デフォルトのこうかとん
         self.imgs = {
             (+1, 0): img,  # 右
-            (+1, -1): pg.transform.rotozoom(img, 45, 0.9),  # 右上
-            (0, -1): pg.transform.rotozoom(img, 90, 0.9),  # 上
-            (-1, -1): pg.transform.rotozoom(img0, -45, 0.9),  # 左上
+            (+1, -1): registry.rotated(path, 45, 0.9, half, flip),  # 右上
+            (0, -1): registry.rotated(path, 90, 0.9, half, flip),  # 上
+            (-1, -1): registry.rotated(path, -45, 0.9, half),  # 左上
             (-1, 0): img0,  # 左
-            (-1, +1): pg.transform.rotozoom(img0, 45, 0.9),  # 左下
-            (0, +1): pg.transform.rotozoom(img, -90, 0.9),  # 下
-            (+1, +1): pg.transform.rotozoom(img, -45, 0.9),  # 右下
+            (-1, +1): registry.rotated(path, 45, 0.9, half),  # 左下
+            (0, +1): registry.rotated(path, -90, 0.9, half, flip),  # 下
+            (+1, +1): registry.rotated(path, -45, 0.9, half, flip),  # 右下
 
         }
         self.dire = (+1, 0)
         self.image = self.imgs[self.dire]
         self.rect = self.image.get_rect()
         self.rect.center = xy
+        self.prev_center = self.rect.center  # 1ティック前の中心座標（描画時の補間用）
         self.speed = 10
+        self.hit_rad = 0  # 当たり判定の円の半径（0なら画像の矩形で判定する）
+        self.focus = False  # 左Shiftで低速移動中か（当たり判定の円はこのときだけ表示する）
 
-    def change_img(self, num: int, screen: pg.Surface):
+    def change_img(self, num: int, screen: pg.Surface | None = None):
         """
         こうかとん画像を切り替え，画面に転送する
         引数1 num：こうかとん画像ファイル名の番号
-        引数2 screen：画面Surface
+        引数2 screen：画面Surface（Noneなら切り替えるだけで転送しない）
         """
-        self.image = pg.transform.rotozoom(pg.image.load(f"fig/{num}.png"), 0, 0.5)
-        self.image = pg.transform.rotozoom(pg.image.load(f"fig/{num}.png"), 0, 0.5)
-        screen.blit(self.image, self.rect)
+        self.image = registry.image(f"fig/{num}.png", ("rotozoom", 0, 0.5))
+        if screen is not None:
+            screen.blit(self.image, self.rect)
 
     def update(self, key_lst: list[bool], screen: pg.Surface):
         """
-        押下キーに応じてこうかとんを移動させる
+        押下キーに応じてこうかとんを移動させ，画面に転送する
         引数1 key_lst：押下キーの真理値リスト
         引数2 screen：画面Surface
         """
+        self.move(key_lst)
+        self.draw(screen)
+
+    def draw(self, screen: pg.Surface, alpha: float = 1.0) -> pg.Rect:
+        """
+        こうかとんを1ティック前と現在の位置の間に補間して画面に転送する
+        引数1 screen：画面Surface
+        引数2 alpha：補間係数（0：1ティック前の位置，1：現在の位置）
+        戻り値：描画した矩形
+        """
+        return __class__.blit(screen, self.image, self.pose(alpha), self.hit_rad if self.focus else 0)
+
+    def pose(self, alpha: float = 1.0) -> pg.Rect:
+        """
+        1ティック前と現在の位置の間に補間した画像の矩形を返す
+        引数 alpha：補間係数（0：1ティック前の位置，1：現在の位置）
+        戻り値：補間した矩形（alphaが1以上ならself.rectそのもの）
+        """
+        if alpha >= 1.0:
+            return self.rect
+        (x0, y0), (x1, y1) = self.prev_center, self.rect.center
+        return self.image.get_rect(center=(round(x0+alpha*(x1-x0)), round(y0+alpha*(y1-y0))))
+
+    @staticmethod
+    def blit(screen: pg.Surface, image: pg.Surface, rct: pg.Rect, hit_rad: int = 0) -> pg.Rect:
+        """
+        こうかとんの画像と当たり判定の円を画面に転送する
+        引数1 screen：画面Surface
+        引数2 image：こうかとんの画像
+        引数3 rct：画像の矩形
+        引数4 hit_rad：当たり判定の円の半径（0なら表示しない）
+        戻り値：描画した矩形
+        """
+        drawn = screen.blit(image, rct)
+        if hit_rad:  # 画像の中心に当たり判定の円を表示する
+            pg.draw.circle(screen, (255, 255, 255), rct.center, hit_rad)
+            pg.draw.circle(screen, (255, 0, 0), rct.center, hit_rad, 2)
+        return drawn
+
+    def move(self, key_lst: list[bool]):
+        """
+        押下キーに応じてこうかとんを1ティック分移動させる
+        引数 key_lst：押下キーの真理値リスト
+        """
+        self.prev_center = self.rect.center
         sum_mv = [0, 0]
         for k, mv in __class__.delta.items():
             if key_lst[k]:
                 sum_mv[0] += mv[0]
                 sum_mv[1] += mv[1]
-            
-            if key_lst[pg.K_LSHIFT]:  # 左Shiftを押しているとき低速化
-                self.speed = 3
-            else:
-                self.speed = 10
+        self.focus = bool(key_lst[pg.K_LSHIFT])
+        self.speed = 3 if self.focus else 10  # 左Shiftを押しているとき低速化
 
         self.rect.move_ip(self.speed*sum_mv[0], self.speed*sum_mv[1])
         if check_bound(self.rect) != (True, True):
@@ -110,7 +173,6 @@ class Bird(pg.sprite.Sprite):
         if not (sum_mv[0] == 0 and sum_mv[1] == 0):
             self.dire = tuple(sum_mv)
             self.image = self.imgs[self.dire]
-        screen.blit(self.image, self.rect)
 
 
 class Bomb(pg.sprite.Sprite):
@@ -118,6 +180,9 @@ class Bomb(pg.sprite.Sprite):
     爆弾に関するクラス
     """
     colors = [(255, 0, 0), (0, 255, 0), (0, 0, 255), (255, 255, 0), (255, 0, 255), (0, 255, 255)]
+    imgs: dict[tuple[tuple[int, int, int], int], pg.Surface] = {}  # (色, 半径)ごとに描画済みの爆弾円Surface
+    keyed: dict[int, pg.Surface] = {}  # 色の添字*64+半径 -> 爆弾円Surface（配列から引くとき用）
+    pool: list["Bomb"] = []  # killされて再利用を待っているBomb
 
     def __init__(self, emy: "Enemy", bird: Bird, tmr:int, bullet:tuple[float,float]=None,):
         """
@@ -128,63 +193,806 @@ class Bomb(pg.sprite.Sprite):
         引数4 bullet：弾べクトルの方向を表すタプル
         """
         super().__init__()
-        if 4500 < tmr <= 9000: #時間が90秒から180秒の間なら爆弾の大きさをランダムにする
-            rad =random.randint(5,11)
-        else: #時間が90秒までなら爆弾の大きさを13に固定する
-            rad = 13
-        self.image = pg.Surface((2*rad, 2*rad))
-        color = random.choice(__class__.colors)  # 爆弾円の色：クラス変数からランダム選択
-        pg.draw.circle(self.image, color, (rad, rad), rad)
-        self.image.set_colorkey((0, 0, 0))
+        self.setup(emy, bird, tmr, bullet)
+
+    @classmethod
+    def spawn(cls, emy: "Enemy", bird: Bird, tmr:int, bullet:tuple[float,float]=None) -> "Bomb":
+        """
+        killされたBombがあれば再利用し，なければ新しく生成する
+        引数はBomb.__init__と同じ
+        戻り値：Bombインスタンス
+        """
+        if cls.pool:
+            bomb = cls.pool.pop()
+            assert not bomb.alive(), "poolのBombがGroupに入っている"
+            bomb.setup(emy, bird, tmr, bullet)
+            return bomb
+        return cls(emy, bird, tmr, bullet)
+
+    @classmethod
+    def circle(cls, color: tuple[int, int, int], rad: int) -> pg.Surface:
+        """
+        (色, 半径)の爆弾円Surfaceを返す（初回だけ描画してキャッシュする）
+        引数1 color：爆弾円の色タプル
+        引数2 rad：爆弾円の半径
+        戻り値：爆弾円Surface
+        """
+        img = cls.imgs.get((color, rad))
+        if img is None:
+            img = pg.Surface((2*rad, 2*rad))
+            pg.draw.circle(img, color, (rad, rad), rad)
+            if pg.display.get_surface() is not None:
+                img = img.convert()  # 画面と同じピクセル形式にして転送を速くする
+            img.set_colorkey((0, 0, 0), pg.RLEACCEL)
+            cls.imgs[(color, rad)] = img
+        return img
+
+    @classmethod
+    def circles(cls, keys: list[int]) -> list[pg.Surface]:
+        """
+        色の添字*64+半径のリストに対応する爆弾円Surfaceのリストを返す
+        引数 keys：色の添字*64+半径のリスト
+        戻り値：爆弾円Surfaceのリスト
+        """
+        try:
+            return list(map(cls.keyed.__getitem__, keys))
+        except KeyError:
+            for k in set(keys)-cls.keyed.keys():
+                cls.keyed[k] = cls.circle(cls.colors[k//64], k % 64)
+            return list(map(cls.keyed.__getitem__, keys))
+
+    @classmethod
+    def prerender(cls):
+        """
+        全ての色と半径（5～13）の爆弾円Surfaceを画面のピクセル形式で描画し直しておく
+        画面の生成後に呼ぶ
+        """
+        cls.imgs.clear()
+        cls.keyed.clear()
+        for color in cls.colors:
+            for rad in range(5, 14):
+                cls.circle(color, rad)
+
+    def kill(self):
+        """
+        全てのGroupから取り除き，再利用のためにpoolへ戻す
+        """
+        if self.alive():
+            super().kill()
+            __class__.pool.append(self)
+
+    def setup(self, emy: "Enemy", bird: Bird, tmr:int, bullet:tuple[float,float]=None):
+        """
+        爆弾の大きさ・色・位置・方向を攻撃形態（patterns.PHASES）から決める（再利用時も呼ばれる）
+        引数はBomb.__init__と同じ（bulletがNoneなら自機に向けて発射する）
+        """
+        phase = phase_at(tmr) or PHASES[-1]
+        lo, hi = phase["rad"]
+        rad = lo if lo == hi else rng.randint(lo, hi)
+        color = rng.choice(__class__.colors)  # 爆弾円の色：クラス変数からランダム選択
+        self.rad = rad  # 当たり判定の円の半径
+        self.image = __class__.circle(color, rad)
         self.rect = self.image.get_rect()
         # 爆弾を投下するemyから見た攻撃対象のbirdの方向を計算
-        self.vx, self.vy = calc_orientation(emy.rect, bird.rect)
-
-        if 4500 < tmr <= 9000: #時間が90秒から180秒の間なら爆弾の動きをランダムに動かす
-            i = random.randint(0,3)
-            if i==0: # 1/3の確率でランダムにボムを飛ばす
-                self.vx, self.vy = random.randint(-1,1), random.randint(0,1)
-                if self.vx == 0 and self.vy == 0: # どちらも0だった場合に、どちらかが0じゃなくなるまでランダムを回し続ける
-                    while True:
-                        self.vx, self.vy = random.randint(-1,1), random.randint(0,1)
-                        if self.vx != 0 or self.vy != 0:
-                            break
-            else: # 2/3の確率でこうかとんに向けてボムを飛ばす
-                self.vx,self.vy = calc_orientation(emy.rect,bird.rect)
-
-        self.rect.centerx = emy.rect.centerx
-        self.rect.centery = emy.rect.centery+emy.rect.height//2
-        if 0 < tmr <= 4500: #時間が90秒以下の時
-            if bullet :#弾べクトルの方向を引数で受け取る
-                self.vx,self.vy = bullet
-            else: # 自機にに向けて発射する
-                self.vx,self.vy = calc_orientation(emy.rect,bird.rect)
-        self.speed = 9
+        self.vx, self.vy = bullet if bullet else calc_orientation(emy.rect, bird.rect)
+        self.pos = [float(emy.rect.centerx), float(emy.rect.centery+emy.rect.height//2)]  # 中心座標（Bulletsと同じく小数で持つ）
+        self.place()
+        self.speed = phase["speed"]
+        self.life, self.bounces = limits(phase)  # 残りの寿命と反射できる回数
+        self.expired = False  # 寿命・反射回数が尽きて消えたか
+
+    def place(self):
+        """
+        小数の中心座標からrectを合わせる（左上の座標はbullet_batchesの描画位置と同じく切り捨てる）
+        """
+        self.rect.topleft = int(self.pos[0]-self.rad), int(self.pos[1]-self.rad)
+
+    def outside(self) -> bool:
+        """
+        爆弾の外接矩形が画面からはみ出しているかを小数の中心座標で判定する（outside_screenと同じ）
+        戻り値：はみ出していればTrue
+        """
+        x, y = self.pos
+        return x-self.rad < 0 or WIDTH < x+self.rad or y-self.rad < 0 or HEIGHT < y+self.rad
 
     def update(self,tmr:int):
         """
-        爆弾を速度ベクトルself.vx, self.vyに基づき移動させる
-        引数 screen：画面Surface
-        引数 tmr：時間経過に伴った反射・消滅の仕様変更
+        爆弾を速度ベクトルself.vx, self.vyに基づき移動させ，画面端では攻撃形態のedgeに従って反射・消滅させる
+        位置は小数のまま進めるので，Bullets.updateと同じ軌道になる
+        引数 tmr：現在の攻撃形態を決める経過ティック
         """
-        if 4500 < tmr <= 9000: #時間が90秒から180秒の間なら爆弾の動きを遅くする
-            j = random.randint(3,8)
-            self.speed = j
-            self.rect.move_ip(self.speed*self.vx, self.speed*self.vy)
-        
-        else: #時間が90秒未満なら爆弾の動きは通常
-            self.rect.move_ip(self.speed*self.vx, self.speed*self.vy)
+        phase = phase_at(tmr) or PHASES[-1]
+        if phase["drift"]:  # ティックごとに速さを選び直す
+            self.speed = rng.randint(*phase["drift"])
+        self.pos[0] += self.speed*self.vx
+        self.pos[1] += self.speed*self.vy
 
-        
-        if check_bound(self.rect) != (True, True):
-            if 4500 < tmr <= 9000: #時間が90秒から180秒なら爆弾の動きは反射
+        if self.outside():
+            if phase["edge"] == "reflect":
                 self.vx *= -1
                 self.vy *= -1
-                self.rect.move_ip(self.speed*self.vx, self.speed*self.vy)
-
-            if tmr <= 4500: # 時間が90秒未満なら画面端で消滅
-                self.rect.move_ip(self.speed*self.vx, self.speed*self.vy)
+                self.pos[0] += self.speed*self.vx
+                self.pos[1] += self.speed*self.vy
+                self.bounces -= 1
+            else:  # 画面端で消滅
                 self.kill()
+        self.place()
+
+        self.life -= 1
+        if self.alive() and (self.life < 0 or self.bounces < 0):  # 寿命・反射回数が尽きたら消滅
+            self.expired = True
+            self.kill()
+
+
+def blit_bullets(screen: pg.Surface, pos: np.ndarray, rad: np.ndarray, color: np.ndarray,
+                 doreturn: bool = True) -> list[pg.Rect]:
+    """
+    爆弾を描画する（BATCH_MIN個以上なら(色, 半径)ごとにまとめ，同じ爆弾円Surfaceを1組につき1回のscreen.blitsで描画する）
+    引数1 screen：描画先Surface
+    引数2 pos：中心座標の配列（n×2）
+    引数3 rad：半径の配列（n，64未満）
+    引数4 color：色（Bomb.colorsの添字）の配列（n）
+    引数5 doreturn：Falseなら描画した矩形を作らない
+    戻り値：描画した矩形のリスト（doreturnがFalseなら空リスト）
+    """
+    return blit_batches(screen, bullet_batches(pos, rad, color), doreturn)
+
+
+BATCH_MIN = 1500  # 爆弾がこの数以上なら(色, 半径)ごとにまとめて描画する（少ないうちは並べ替えの分だけ遅い）
+
+
+def bullet_batches(pos: np.ndarray, rad: np.ndarray,
+                   color: np.ndarray) -> list[tuple[pg.Surface | list[pg.Surface], list, list]]:
+    """
+    爆弾を爆弾円Surfaceと左上の座標の列の組にする（描画はblit_batches）
+    BATCH_MIN個以上なら(色, 半径)ごとにまとめて1組1枚のSurfaceにし，少なければ配列の順のまま1組にする
+    引数1 pos：中心座標の配列（n×2）
+    引数2 rad：半径の配列（n，64未満）
+    引数3 color：色（Bomb.colorsの添字）の配列（n）
+    戻り値：(爆弾円Surfaceまたは爆弾ごとの爆弾円Surfaceのリスト, x座標のリスト, y座標のリスト)のリスト
+    """
+    n = len(rad)
+    if n == 0:
+        return []
+    if n < BATCH_MIN:
+        dest = (pos-rad[:, None]).astype(np.int32)  # blitと同じく0方向に切り捨てる
+        return [(Bomb.circles((color*64+rad).tolist()), dest[:, 0].tolist(), dest[:, 1].tolist())]
+    key = (color*64+rad).astype(np.int16)
+    order = np.argsort(key, kind="stable")  # 16bit整数の安定ソートは基数ソートで速い
+    key = key[order]
+    dest = (pos-rad[:, None]).astype(np.int32)[order]  # blitと同じく0方向に切り捨ててから並べ替える（整数の方が並べ替えが速い）
+    xs, ys = dest[:, 0].tolist(), dest[:, 1].tolist()  # (x, y)のタプルにするとblitsが速い
+    cuts = [0, *(np.flatnonzero(np.diff(key))+1).tolist(), n]
+    colors = Bomb.colors
+    return [(Bomb.circle(colors[k//64], k % 64), xs[i:j], ys[i:j])
+            for k, i, j in zip(key[cuts[:-1]].tolist(), cuts, cuts[1:])]
+
+
+def blit_batches(screen: pg.Surface, batches: list[tuple[pg.Surface | list[pg.Surface], list, list]],
+                 doreturn: bool = True) -> list[pg.Rect]:
+    """
+    bullet_batchesでまとめた爆弾を，1組につき1回のscreen.blitsで描画する
+    引数1 screen：描画先Surface
+    引数2 batches：bullet_batchesの戻り値
+    引数3 doreturn：Falseなら描画した矩形を作らない
+    戻り値：描画した矩形のリスト（doreturnがFalseなら空リスト）
+    """
+    rects = []
+    for img, xs, ys in batches:
+        drawn = screen.blits(zip(repeat(img) if isinstance(img, pg.Surface) else img, zip(xs, ys)), doreturn)
+        if doreturn:
+            rects += drawn
+    return rects
+
+
+def outside_screen(pos: np.ndarray, rad: np.ndarray) -> np.ndarray:
+    """
+    爆弾の外接矩形が画面からはみ出しているかを一括で判定する
+    引数1 pos：中心座標の配列（n×2）
+    引数2 rad：半径の配列（n）
+    戻り値：はみ出している爆弾の真理値配列
+    """
+    return ((pos[:, 0]-rad < 0) | (WIDTH < pos[:, 0]+rad) |
+            (pos[:, 1]-rad < 0) | (HEIGHT < pos[:, 1]+rad))
+
+
+class BulletArrays:
+    """
+    爆弾ごとの値を，名前をfieldsに並べた配列の先頭n個に持つクラス（BulletsとLinearBulletsの共通部分）
+    """
+    fields: tuple[str, ...] = ()  # 爆弾ごとの配列の名前
+    n: int  # 使っている配列の長さ
+
+    def _reserve(self, k: int):
+        """
+        k個の爆弾を追加できるように配列を広げる
+        引数 k：追加する爆弾の数
+        """
+        size = len(getattr(self, self.fields[0]))
+        if self.n+k <= size:
+            return
+        capacity = max(2*size, self.n+k)
+        for name in self.fields:
+            old = getattr(self, name)
+            new = np.zeros((capacity,)+old.shape[1:], dtype=old.dtype)
+            new[:self.n] = old[:self.n]
+            setattr(self, name, new)
+
+
+class Bullets(BulletArrays):
+    """
+    爆弾をNumPy配列でまとめて管理するクラス
+    Bombを1個ずつSpriteとして持つ代わりに，中心座標・方向ベクトル・速さ・半径・色・寿命・反射できる回数を連続した配列に持ち，
+    移動・反射・画面外での消滅を1回の配列演算で行う
+    lazyのときは，等速直線運動をして画面端で消えるだけの攻撃形態の爆弾をLinearBulletsに入れ，毎ティック移動させない
+    """
+    fields = ("pos", "prev", "vel", "speed", "rad", "color", "life", "bounce")  # 爆弾ごとの配列の名前
+
+    def __init__(self, seed: int | None = None, capacity: int = 1024, budget: BulletBudget | None = None,
+                 lazy: bool = False):
+        """
+        空の爆弾配列を確保する
+        引数1 seed：速さ・半径・色などを決める乱数のシード
+        引数2 capacity：最初に確保する爆弾数（足りなくなったら倍に広げる）
+        引数3 budget：爆弾数の上限を守るBulletBudget（Noneなら無制限）
+        引数4 lazy：Trueなら等速直線運動の爆弾の位置を発射時の状態から計算する（LinearBullets）
+        """
+        self.rng = np.random.default_rng(seed)
+        self.patterns = PatternEngine(self.rng)  # 攻撃形態ごとの弾幕の表（乱数生成器を共有する）
+        self.budget = budget if budget is not None else BulletBudget(0)
+        self.n = 0  # 生きている爆弾の数（配列の先頭n個が有効）
+        self.pos = np.zeros((capacity, 2))  # 中心座標
+        self.prev = np.zeros((capacity, 2))  # 1ティック前の中心座標（描画時の補間用）
+        self.vel = np.zeros((capacity, 2))  # 方向ベクトル
+        self.speed = np.zeros(capacity)  # 速さ
+        self.rad = np.zeros(capacity, dtype=np.int32)  # 半径
+        self.color = np.zeros(capacity, dtype=np.int32)  # Bomb.colorsの添字
+        self.life = np.zeros(capacity, dtype=np.int32)  # 残りの寿命（ティック）
+        self.bounce = np.zeros(capacity, dtype=np.int32)  # 残りの反射できる回数
+        self.linear = LinearBullets(capacity) if lazy else None  # 位置を発射時の状態から計算する爆弾
+
+    def __len__(self) -> int:
+        return self.n+len(self.linear) if self.linear is not None else self.n
+
+    def add(self, pos: np.ndarray, vel: np.ndarray, speed: np.ndarray, rad: np.ndarray, color: np.ndarray,
+            life: int = NO_LIMIT, bounce: int = NO_LIMIT):
+        """
+        爆弾をまとめて追加する
+        引数1 pos：中心座標の配列（k×2）
+        引数2 vel：方向ベクトルの配列（k×2）
+        引数3 speed：速さの配列（k）
+        引数4 rad：半径の配列（k）
+        引数5 color：色（Bomb.colorsの添字）の配列（k）
+        引数6 life：寿命（ティック）
+        引数7 bounce：反射できる回数
+        """
+        k = len(speed)
+        self._reserve(k)
+        sl = slice(self.n, self.n+k)
+        self.pos[sl] = pos
+        self.prev[sl] = pos
+        self.vel[sl] = vel
+        self.speed[sl] = speed
+        self.rad[sl] = rad
+        self.color[sl] = color
+        self.life[sl] = life
+        self.bounce[sl] = bounce
+        self.n += k
+
+    def emit(self, emy: "Enemy", bird: Bird, tmr: int):
+        """
+        tmrのときの攻撃形態の一斉射撃をSpawnTableから読み出してまとめて追加する
+        爆弾数が上限に近いときはbudgetに従って一斉射撃の先頭から間引いた数だけ追加する
+        引数1 emy：爆弾を投下する敵機
+        引数2 bird：攻撃対象のこうかとん
+        引数3 tmr：攻撃形態を決める経過ティック
+        """
+        volley = self.patterns.volley(tmr, calc_orientation(emy.rect, bird.rect))
+        if volley is None:
+            return
+        vel, rad, color, speed, life, bounce = volley
+        k = self.budget.allow(len(self), len(vel))
+        pos = np.empty((k, 2))
+        pos[:] = emy.rect.centerx, emy.rect.centery+emy.rect.height//2
+        if self.linear is not None and is_linear(self.patterns.phase(tmr)):
+            self.linear.add(pos, vel[:k], np.full(k, float(speed)), rad[:k], color[:k], tmr)
+            return
+        self.add(pos, vel[:k], np.full(k, float(speed)), rad[:k], color[:k], life, bounce)
+
+    def remove(self, mask: np.ndarray) -> np.ndarray:
+        """
+        maskがTrueの爆弾を取り除き，配列を詰める
+        引数 mask：取り除く爆弾の真理値配列（長さn）
+        戻り値：取り除いた爆弾の中心座標の配列
+        """
+        removed = self.pos[:self.n][mask].copy()
+        keep = ~mask
+        m = int(keep.sum())
+        for name in __class__.fields:
+            arr = getattr(self, name)
+            arr[:m] = arr[:self.n][keep]
+        self.n = m
+        return removed
+
+    def update(self, tmr: int):
+        """
+        tmrのときの攻撃形態の規則（drift・edge）で全爆弾を一括で移動させる
+        引数 tmr：攻撃形態を決める経過ティック
+        """
+        phase = self.patterns.phase(tmr)
+        if self.linear is not None:
+            if is_linear(phase):
+                self.linear.update(tmr)  # 画面から出る爆弾だけを取り除く
+            elif len(self.linear):  # 1ティックずつ移動させる管理に，先に発射された順として先頭に移す
+                pos, prev, vel, speed, rad, color = self.linear.take()
+                k = len(speed)
+                self.add(pos, vel, speed, rad, color)
+                self.prev[self.n-k:self.n] = prev
+                for name in __class__.fields:
+                    arr = getattr(self, name)
+                    arr[:self.n] = np.concatenate([arr[self.n-k:self.n], arr[:self.n-k]])
+        n = self.n
+        if n == 0:
+            return
+        pos, vel, speed = self.pos[:n], self.vel[:n], self.speed[:n]
+        self.prev[:n] = pos
+        if phase is not None and phase["drift"]:  # 速さをティックごとにランダムに選び直す
+            lo, hi = phase["drift"]
+            speed[:] = self.rng.integers(lo, hi+1, n)
+        pos += speed[:, None]*vel
+        self.life[:n] -= 1
+        if phase is None:
+            return
+        out = outside_screen(pos, self.rad[:n])
+        if phase["edge"] == "reflect":  # 画面端で反射
+            vel[out] *= -1
+            pos[out] += speed[out, None]*vel[out]
+            self.bounce[:n][out] -= 1
+        elif phase["edge"] == "kill":  # 画面端で消滅
+            self.remove(out)
+            n = self.n
+        expired = (self.life[:n] < 0) | (self.bounce[:n] < 0)  # 寿命・反射回数が尽きたら消滅
+        if expired.any():
+            self.budget.expired += int(expired.sum())
+            self.remove(expired)
+
+    def collide(self, rct: pg.Rect) -> np.ndarray:
+        """
+        rctと重なる爆弾を取り除く（spritecollideのdokill=Trueに相当）
+        引数 rct：こうかとんなどのRect
+        戻り値：取り除いた爆弾の中心座標の配列
+        """
+        def hit_test(pos: np.ndarray, rad: np.ndarray) -> np.ndarray:
+            return ((pos[:, 0]-rad < rct.right) & (rct.left < pos[:, 0]+rad) &
+                    (pos[:, 1]-rad < rct.bottom) & (rct.top < pos[:, 1]+rad))
+        return self._collide(hit_test)
+
+    def collide_circle(self, xy: tuple[float, float], r: float) -> np.ndarray:
+        """
+        中心xy・半径rの円と重なる爆弾（爆弾も円として扱う）を，全爆弾の距離の2乗を一括で計算して取り除く
+        引数1 xy：こうかとんの当たり判定の円の中心座標
+        引数2 r：こうかとんの当たり判定の円の半径
+        戻り値：取り除いた爆弾の中心座標の配列
+        """
+        def hit_test(pos: np.ndarray, rad: np.ndarray) -> np.ndarray:
+            dx = pos[:, 0]-xy[0]
+            dy = pos[:, 1]-xy[1]
+            reach = rad+r
+            return dx*dx+dy*dy < reach*reach
+        return self._collide(hit_test)
+
+    def _collide(self, hit_test) -> np.ndarray:
+        """
+        当たり判定で重なった爆弾を取り除く（LinearBulletsの爆弾を先に調べる）
+        引数 hit_test：中心座標と半径の配列から重なっているかの真理値配列を返す関数
+        戻り値：取り除いた爆弾の中心座標の配列
+        """
+        hit = hit_test(self.pos[:self.n], self.rad[:self.n])
+        removed = self.remove(hit) if hit.any() else self.pos[:0].copy()
+        if self.linear is not None and len(self.linear):
+            removed = np.concatenate([self.linear.collide(hit_test), removed])
+        return removed
+
+    def draw(self, screen: pg.Surface, alpha: float = 1.0, doreturn: bool = True) -> list[pg.Rect]:
+        """
+        全爆弾を1ティック前と現在の位置の間に補間して画面に描画する
+        引数1 screen：画面Surface
+        引数2 alpha：補間係数（0：1ティック前の位置，1：現在の位置）
+        引数3 doreturn：Falseなら描画した矩形を作らない（画面全体を描き直すとき）
+        戻り値：描画した矩形のリスト（doreturnがFalseなら空リスト）
+        """
+        return blit_batches(screen, self.batches(alpha), doreturn)
+
+    def batches(self, alpha: float = 1.0) -> list[tuple]:
+        """
+        全爆弾を1ティック前と現在の位置の間に補間し，描画用に(色, 半径)ごとにまとめる
+        引数 alpha：補間係数（0：1ティック前の位置，1：現在の位置）
+        戻り値：bullet_batchesの戻り値（配列を参照しないので，爆弾を動かしても変わらない）
+        """
+        pos, rad, color = self.pos[:self.n], self.rad[:self.n], self.color[:self.n]
+        if alpha < 1.0:
+            prev = self.prev[:self.n]
+            pos = prev+alpha*(pos-prev)
+        if self.linear is not None and len(self.linear):
+            idx = self.linear.active()
+            pos = np.concatenate([self.linear.positions(idx, alpha), pos])
+            rad = np.concatenate([self.linear.rad[idx], rad])
+            color = np.concatenate([self.linear.color[idx], color])
+        return bullet_batches(pos, rad, color)
+
+    def kinematics(self) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        全爆弾の中心座標・1ティックの移動量・半径を返す（ボットの予測用）
+        戻り値：中心座標(n, 2)・移動量(n, 2)・半径(n,)の配列のタプル
+        """
+        n = self.n
+        pos, step, rad = self.pos[:n], self.vel[:n]*self.speed[:n, None], self.rad[:n]
+        if self.linear is not None and len(self.linear):
+            lin = self.linear
+            idx = lin.active()
+            pos = np.concatenate([lin.positions(idx), pos])
+            step = np.concatenate([lin.vel[idx]*lin.speed[idx, None], step])
+            rad = np.concatenate([lin.rad[idx], rad])
+        return pos, step, rad
+
+
+class LinearBullets(BulletArrays):
+    """
+    等速直線運動をして画面端で消えるだけの爆弾を，発射時の状態から位置を計算して管理するクラス
+    発射位置・方向ベクトル・速さ・発射ティックを持ち，位置は当たり判定や描画のときにだけ計算する
+    画面から出るティックは発射時に計算してティックごとのバケツに入れておくので，消滅は消える爆弾の数だけの処理で済む
+    取り除いた爆弾の枠は詰めずに残し，空き枠が生きている爆弾より多くなったらまとめて詰める
+    """
+    fields = ("origin", "vel", "speed", "born", "rad", "color", "alive")  # 爆弾ごとの配列の名前
+
+    def __init__(self, capacity: int = 1024):
+        """
+        空の爆弾配列を確保する
+        引数 capacity：最初に確保する枠の数（足りなくなったら倍に広げる）
+        """
+        self.n = 0  # 使った枠の数（配列の先頭n個のうちaliveがTrueのものが有効）
+        self.live = 0  # 生きている爆弾の数
+        self.now = 0  # 現在のティック（発射からの経過ティックを数える基準）
+        self.origin = np.zeros((capacity, 2))  # 発射位置
+        self.vel = np.zeros((capacity, 2))  # 方向ベクトル
+        self.speed = np.zeros(capacity)  # 速さ
+        self.born = np.zeros(capacity, dtype=np.int64)  # 発射ティック
+        self.rad = np.zeros(capacity, dtype=np.int32)  # 半径
+        self.color = np.zeros(capacity, dtype=np.int32)  # Bomb.colorsの添字
+        self.alive = np.zeros(capacity, dtype=bool)
+        self.buckets: dict[int, list[int]] = {}  # 画面から出るティック -> 枠の添字のリスト
+
+    def __len__(self) -> int:
+        return self.live
+
+    @staticmethod
+    def exit_after(origin: np.ndarray, step: np.ndarray, rad: np.ndarray) -> np.ndarray:
+        """
+        何ティック移動した後に初めて画面からはみ出すかを計算する
+        軸ごとに端までの距離を移動量で割って求め，位置の計算（origin+k*step）の丸め誤差の分を前後1ティックで確かめ直す
+        引数1 origin：発射位置の配列（k×2）
+        引数2 step：1ティックの移動量の配列（k×2）
+        引数3 rad：半径の配列（k）
+        戻り値：移動するティック数の配列（1以上，画面から出ない爆弾はNO_LIMIT）
+        """
+        lo = rad[:, None].astype(float)
+        hi = np.array([WIDTH, HEIGHT])-lo
+        with np.errstate(divide="ignore", invalid="ignore"):
+            k = np.where(step > 0, (hi-origin)/step, np.where(step < 0, (lo-origin)/step, np.inf))
+        k = np.floor(np.nan_to_num(k.min(axis=1), posinf=NO_LIMIT))+1
+        k = np.clip(k, 1, NO_LIMIT).astype(np.int64)
+        moving = k < NO_LIMIT
+        earlier = moving & (k > 1) & outside_screen(origin+(k-1)[:, None]*step, rad)
+        k[earlier] -= 1
+        later = moving & ~outside_screen(origin+k[:, None]*step, rad)
+        k[later] += 1
+        return k
+
+    def add(self, pos: np.ndarray, vel: np.ndarray, speed: np.ndarray, rad: np.ndarray, color: np.ndarray, tmr: int):
+        """
+        tmrに発射した爆弾をまとめて追加し，画面から出るティックのバケツに入れる
+        引数1 pos：発射位置の配列（k×2）
+        引数2 vel：方向ベクトルの配列（k×2）
+        引数3 speed：速さの配列（k）
+        引数4 rad：半径の配列（k）
+        引数5 color：色（Bomb.colorsの添字）の配列（k）
+        引数6 tmr：発射ティック（このティックのupdateから移動を始める）
+        """
+        k = len(speed)
+        self._reserve(k)
+        sl = slice(self.n, self.n+k)
+        self.origin[sl] = pos
+        self.vel[sl] = vel
+        self.speed[sl] = speed
+        self.born[sl] = tmr
+        self.rad[sl] = rad
+        self.color[sl] = color
+        self.alive[sl] = True
+        # exit_afterティック移動するupdate（発射ティックから数えて）で画面から出る
+        for t, i in zip((tmr-1+self.exit_after(self.origin[sl], speed[:, None]*vel, self.rad[sl])).tolist(),
+                        range(self.n, self.n+k)):
+            self.buckets.setdefault(t, []).append(i)
+        self.n += k
+        self.live += k
+        self.now = tmr
+
+    def active(self) -> np.ndarray:
+        """
+        生きている爆弾の枠の添字を返す
+        """
+        return np.flatnonzero(self.alive[:self.n])
+
+    def positions(self, idx: np.ndarray, alpha: float = 1.0) -> np.ndarray:
+        """
+        爆弾の中心座標を発射位置・移動量・経過ティックから計算する
+        引数1 idx：枠の添字の配列
+        引数2 alpha：補間係数（0：1ティック前の位置，1：現在の位置）
+        戻り値：中心座標の配列（len(idx)×2）
+        """
+        k = (self.now-1-self.born[idx])+alpha
+        return self.origin[idx]+k[:, None]*(self.speed[idx, None]*self.vel[idx])
+
+    def discard(self, idx: np.ndarray):
+        """
+        爆弾を取り除く（枠は空けたまま残し，空き枠が多くなったら詰める）
+        引数 idx：取り除く爆弾の枠の添字の配列
+        """
+        self.alive[idx] = False
+        self.live -= len(idx)
+        if self.n-self.live > max(64, self.live):
+            self.compact()
+
+    def compact(self):
+        """
+        生きている爆弾を順番を保って配列の先頭に詰め，バケツの添字を付け替える
+        """
+        keep = self.active()
+        where = np.full(self.n, -1)
+        where[keep] = np.arange(len(keep))
+        for name in __class__.fields:
+            arr = getattr(self, name)
+            arr[:len(keep)] = arr[keep]
+        self.alive[len(keep):self.n] = False
+        self.n = len(keep)
+        buckets = {}
+        for t, ids in self.buckets.items():
+            moved = [j for j in where[ids].tolist() if j >= 0]
+            if moved:
+                buckets[t] = moved
+        self.buckets = buckets
+
+    def update(self, tmr: int) -> int:
+        """
+        tmrのティックを進め，このティックで画面から出る爆弾をバケツから取り出して取り除く
+        引数 tmr：経過ティック
+        戻り値：取り除いた爆弾の数
+        """
+        self.now = tmr+1
+        ids = self.buckets.pop(tmr, None)
+        if ids is None:
+            return 0
+        ids = np.array(ids)
+        ids = ids[self.alive[ids]]  # 当たり判定ですでに取り除いた爆弾を除く
+        self.discard(ids)
+        return len(ids)
+
+    def collide(self, hit_test) -> np.ndarray:
+        """
+        当たり判定で重なった爆弾を取り除く
+        引数 hit_test：中心座標と半径の配列から重なっているかの真理値配列を返す関数
+        戻り値：取り除いた爆弾の中心座標の配列
+        """
+        idx = self.active()
+        pos = self.positions(idx)
+        hit = hit_test(pos, self.rad[idx])
+        if not hit.any():
+            return pos[:0]
+        self.discard(idx[hit])
+        return pos[hit]
+
+    def take(self) -> tuple[np.ndarray, ...]:
+        """
+        全爆弾を取り出して空にする（攻撃形態が変わり，1ティックずつ移動させる管理に移すとき）
+        戻り値：中心座標・1ティック前の中心座標・方向ベクトル・速さ・半径・色の配列のタプル
+        """
+        idx = self.active()
+        taken = (self.positions(idx), self.positions(idx, 0.0), self.vel[idx], self.speed[idx], self.rad[idx],
+                 self.color[idx])
+        self.alive[:self.n] = False
+        self.n = self.live = 0
+        self.buckets.clear()
+        return taken
+
+
+class SpatialHash:
+    """
+    画面を一様なマス目に分割し，各マスに重なっているSpriteを記録する当たり判定の絞り込み用クラス
+    判定対象の周辺のマスに入っているSpriteだけを調べるので，判定コストは全体の数ではなく周辺の密度に比例する
+    """
+    def __init__(self, cell: int = 50):
+        """
+        空のマス目を生成する
+        引数 cell：1マスの一辺の長さ
+        """
+        self.cell = cell
+        self.cells: dict[tuple[int, int], set[pg.sprite.Sprite]] = {}  # マス -> 入っているSprite
+        self.spans: dict[pg.sprite.Sprite, tuple[int, int, int, int]] = {}  # Sprite -> 重なっているマスの範囲
+        self.order: dict[pg.sprite.Sprite, int] = {}  # Sprite -> 登録順（判定結果の順序をGroupと同じく決定的にする）
+        self.serial = 0
+        self.cells_probed = 0  # 判定で調べたマスの数
+        self.candidates_tested = 0  # 判定で矩形の重なりを調べたSpriteの数
+
+    def _span(self, rct: pg.Rect) -> tuple[int, int, int, int]:
+        """
+        rctが重なっているマスの範囲を返す
+        引数 rct：判定対象のRect
+        戻り値：左端・上端・右端・下端のマス番号のタプル
+        """
+        c = self.cell
+        return rct.left//c, rct.top//c, (rct.right-1)//c, (rct.bottom-1)//c
+
+    def _cells(self, span: tuple[int, int, int, int]):
+        x0, y0, x1, y1 = span
+        for i in range(x0, x1+1):
+            for j in range(y0, y1+1):
+                yield i, j
+
+    def _bin(self, spr: pg.sprite.Sprite, span: tuple[int, int, int, int]):
+        self.spans[spr] = span
+        for key in self._cells(span):
+            self.cells.setdefault(key, set()).add(spr)
+
+    def _unbin(self, spr: pg.sprite.Sprite, span: tuple[int, int, int, int]):
+        for key in self._cells(span):
+            members = self.cells[key]
+            members.discard(spr)
+            if not members:
+                del self.cells[key]
+
+    def insert(self, spr: pg.sprite.Sprite):
+        """
+        Spriteをrectが重なっているマスに登録する
+        引数 spr：登録するSprite
+        """
+        self._bin(spr, self._span(spr.rect))
+        self.order[spr] = self.serial
+        self.serial += 1
+
+    def remove(self, spr: pg.sprite.Sprite):
+        """
+        Spriteをマス目から取り除く
+        引数 spr：取り除くSprite
+        """
+        span = self.spans.pop(spr, None)
+        if span is None:
+            return
+        self._unbin(spr, span)
+        del self.order[spr]
+
+    def move(self, spr: pg.sprite.Sprite):
+        """
+        移動したSpriteを登録し直す（重なっているマスが変わらなければ何もしない）
+        引数 spr：移動したSprite
+        """
+        span = self._span(spr.rect)
+        old = self.spans[spr]
+        if old != span:
+            self._unbin(spr, old)
+            self._bin(spr, span)
+
+    def query(self, rct: pg.Rect) -> set[pg.sprite.Sprite]:
+        """
+        rctと同じマスに入っているSprite（当たりの候補）を返す
+        引数 rct：判定対象のRect
+        戻り値：候補のSpriteの集合
+        """
+        found = set()
+        for key in self._cells(self._span(rct)):
+            self.cells_probed += 1
+            members = self.cells.get(key)
+            if members:
+                found |= members
+        return found
+
+    def spritecollide(self, sprite: pg.sprite.Sprite, dokill: bool) -> list[pg.sprite.Sprite]:
+        """
+        pg.sprite.spritecollideの代わりに，周辺のマスの候補だけを調べる
+        引数1 sprite：判定対象のSprite
+        引数2 dokill：Trueなら衝突したSpriteをkillする
+        戻り値：衝突したSpriteのリスト
+        """
+        candidates = self.query(sprite.rect)
+        self.candidates_tested += len(candidates)
+        hits = sorted((spr for spr in candidates if sprite.rect.colliderect(spr.rect)), key=self.order.__getitem__)
+        if dokill:
+            for spr in hits:
+                spr.kill()
+        return hits
+
+    def circlecollide(self, xy: tuple[int, int], r: int, dokill: bool) -> list[pg.sprite.Sprite]:
+        """
+        中心xy・半径rの円と，中心pos・半径radの円として扱った登録済みのSprite（Bomb）との当たり判定をする
+        引数1 xy：判定する円の中心座標
+        引数2 r：判定する円の半径
+        引数3 dokill：Trueなら衝突したSpriteをkillする
+        戻り値：衝突したSpriteのリスト
+        """
+        x, y = xy
+        candidates = self.query(pg.Rect(x-r, y-r, 2*r+1, 2*r+1))
+        self.candidates_tested += len(candidates)
+        hits = []
+        for spr in candidates:
+            dx, dy = spr.pos[0]-x, spr.pos[1]-y  # Bombの小数の中心座標で判定する
+            if dx*dx+dy*dy < (spr.rad+r)**2:
+                hits.append(spr)
+        hits.sort(key=self.order.__getitem__)
+        if dokill:
+            for spr in hits:
+                spr.kill()
+        return hits
+
+    def groupcollide(self, group: pg.sprite.AbstractGroup, dokill: bool) -> dict[pg.sprite.Sprite, list[pg.sprite.Sprite]]:
+        """
+        pg.sprite.groupcollide(登録済みのSprite, group, dokill, False)の代わりに，周辺のマスの候補だけを調べる
+        引数1 group：判定対象のSpriteのGroup
+        引数2 dokill：Trueなら衝突した登録済みのSpriteをkillする
+        戻り値：衝突した登録済みのSpriteをキー，衝突したgroupのSpriteのリストを値とする辞書
+        """
+        crashed = {}
+        for other in group:
+            candidates = self.query(other.rect)
+            self.candidates_tested += len(candidates)
+            for spr in candidates:
+                if other.rect.colliderect(spr.rect):
+                    crashed.setdefault(spr, []).append(other)
+        crashed = dict(sorted(crashed.items(), key=lambda item: self.order[item[0]]))
+        if dokill:
+            for spr in crashed:
+                spr.kill()
+        return crashed
+
+    def stats(self) -> dict:
+        """
+        判定コストのカウンタを返す
+        戻り値：登録数・使用中のマス数・調べたマス数・調べた候補数の辞書
+        """
+        return {
+            "sprites": len(self.spans),
+            "cells": len(self.cells),
+            "cells_probed": self.cells_probed,
+            "candidates_tested": self.candidates_tested,
+        }
+
+
+class BombGroup(pg.sprite.Group):
+    """
+    SpatialHashを持つ爆弾用のGroup
+    追加・削除・移動に合わせてマス目を差分更新する
+    """
+    def __init__(self, *sprites, cell: int = 50, budget: BulletBudget | None = None):
+        self.hash = SpatialHash(cell)
+        self.budget = budget if budget is not None else BulletBudget(0)  # 消滅数を数える
+        super().__init__(*sprites)
+
+    def add_internal(self, sprite, layer=None):
+        super().add_internal(sprite, layer)
+        self.hash.insert(sprite)
+
+    def remove_internal(self, sprite):
+        super().remove_internal(sprite)
+        self.hash.remove(sprite)
+
+    def update(self, *args, **kwargs):
+        """
+        全爆弾を移動させた後，マスが変わった爆弾だけマス目に登録し直す
+        """
+        sprites = self.sprites()
+        super().update(*args, **kwargs)
+        for spr in sprites:
+            if spr.alive():
+                self.hash.move(spr)
+            elif spr.expired:
+                self.budget.expired += 1
 
 
 class Beam(pg.sprite.Sprite):
@@ -200,7 +1008,7 @@ class Beam(pg.sprite.Sprite):
         super().__init__()
         self.vx, self.vy = bird.dire
         angle = math.degrees(math.atan2(-self.vy, self.vx))
-        self.image = pg.transform.rotozoom(pg.image.load(f"fig/beam.png"), angle, 1.0)
+        self.image = registry.rotated("fig/beam.png", angle)  # 5度刻みの回転画像を共有する
         self.vx = math.cos(math.radians(angle))
         self.vy = -math.sin(math.radians(angle))
         self.rect = self.image.get_rect()
@@ -217,83 +1025,171 @@ class Beam(pg.sprite.Sprite):
         if check_bound(self.rect) != (True, True):
             self.kill()
 
-class Explosion(pg.sprite.Sprite):
+
+class Explosions:
     """
-    爆発に関するクラス
+    爆発エフェクトをNumPy配列でまとめて管理するクラス
+    爆発を1個ずつSpriteとして持つ代わりに，中心座標と残り時間を配列に持ち，共有の2枚の爆発画像で一括描画する
+    同時に表示する数はcapまでで，超えるときは近くの爆発を1つにまとめ，それでも多ければ間引く
     """
-    def __init__(self, obj: "Bomb|Enemy", life: int):
+    def __init__(self, cap: int = 128, merge: int = 40):
+        """
+        引数1 cap：同時に表示する爆発の最大数
+        引数2 merge：上限を超えたときに1つにまとめる範囲（マスの一辺の画素数）
         """
-        爆弾が爆発するエフェクトを生成する
-        引数1 obj：爆発するBombまたは敵機インスタンス
+        self.cap = cap
+        self.merge = merge
+        self.n = 0  # 表示中の爆発の数（配列の先頭n個が有効）
+        self.pos = np.zeros((cap, 2), dtype=np.int32)  # 中心座標
+        self.life = np.zeros(cap, dtype=np.int32)  # 残り時間
+        self.imgs = None
+        self.merged = 0  # まとめて減らした爆発の数
+        self.dropped = 0  # 間引いた爆発の数
+
+    def __len__(self) -> int:
+        return self.n
+
+    def add(self, xys: list[tuple[float, float]], life: int):
+        """
+        爆発をまとめて追加する（capを超える分はまとめるか間引く）
+        引数1 xys：爆発の中心座標のリスト
         引数2 life：爆発時間
         """
-        super().__init__()
-        img = pg.image.load(f"fig/explosion.gif")
-        self.imgs = [img, pg.transform.flip(img, 1, 1)]
-        self.image = self.imgs[0]
-        self.rect = self.image.get_rect(center=obj.rect.center)
-        self.life = life
+        if not len(xys):
+            return
+        xys = np.asarray(xys, dtype=np.int32).reshape(-1, 2)
+        free = self.cap-self.n
+        if len(xys) > free:  # 同じマスの爆発は1つにまとめる
+            _, first = np.unique(xys//self.merge, axis=0, return_index=True)
+            self.merged += len(xys)-len(first)
+            xys = xys[np.sort(first)]
+        if len(xys) > free:  # まだ多ければ等間隔に間引く
+            self.dropped += len(xys)-free
+            xys = xys[np.linspace(0, len(xys)-1, free).astype(int)] if free else xys[:0]
+        k = len(xys)
+        self.pos[self.n:self.n+k] = xys
+        self.life[self.n:self.n+k] = life
+        self.n += k
 
     def update(self):
         """
-        爆発時間を1減算した爆発経過時間_lifeに応じて爆発画像を切り替えることで
-        爆発エフェクトを表現する
+        残り時間を1減らし，時間切れの爆発を取り除く
         """
-        self.life -= 1
-        self.image = self.imgs[self.life//10%2]
-        if self.life < 0:
-            self.kill()
+        n = self.n
+        if n == 0:
+            return
+        life = self.life[:n]
+        life -= 1
+        keep = life >= 0
+        m = int(keep.sum())
+        if m < n:
+            self.pos[:m] = self.pos[:n][keep]
+            self.life[:m] = life[keep]
+            self.n = m
+
+    def draw(self, screen: pg.Surface, stride: int = 1) -> list[pg.Rect]:
+        """
+        全爆発を残り時間に応じた爆発画像（10ティックごとに上下左右反転した画像と交互）で一括描画する
+        引数1 screen：画面Surface
+        引数2 stride：strideつおきに描画する（描画の質を下げるとき）
+        戻り値：描画した矩形のリスト
+        """
+        if self.n == 0:
+            return []
+        return screen.blits(self.blits(stride))
+
+    def blits(self, stride: int = 1) -> list[tuple[pg.Surface, tuple[int, int]]]:
+        """
+        全爆発の(爆発画像, 左上の座標)の列を返す（screen.blitsにそのまま渡せる）
+        引数 stride：strideつおきに返す
+        戻り値：(爆発画像, 左上の座標)のリスト
+        """
+        if self.n == 0:
+            return []
+        if self.imgs is None:
+            self.imgs = [registry.image("fig/explosion.gif"), registry.image("fig/explosion.gif", ("flip", True, True))]
+        w, h = self.imgs[0].get_size()
+        imgs = self.imgs
+        return [(imgs[t//10 % 2], (x-w//2, y-h//2))
+                for (x, y), t in zip(self.pos[:self.n:stride].tolist(), self.life[:self.n:stride].tolist())]
+
+    def stats(self) -> dict:
+        """
+        上限による間引きの状況を返す
+        戻り値：上限・表示中の数・まとめた数・間引いた数の辞書
+        """
+        return {"cap": self.cap, "live": self.n, "merged": self.merged, "dropped": self.dropped}
 
 
 class Enemy(pg.sprite.Sprite):
     """
     敵機に関するクラス
     """
-    imgs = [pg.image.load(f"fig/alien{2}.png") for i in range(1, 4)]
+    imgs = [f"fig/alien{2}.png" for i in range(1, 4)]  # 敵機画像のファイル名
     
     def __init__(self, tmr):
         super().__init__()
-        self.image = pg.transform.rotozoom(random.choice(__class__.imgs), 0, 2)
+        self.image = registry.image(rng.choice(__class__.imgs), ("rotozoom", 0, 2))
         self.rect = self.image.get_rect()
         self.rect.center = ((WIDTH - 128) / 1.7, HEIGHT /7)
         self.vx, self.vy = 0, +6
-        self.bound = random.randint(50, HEIGHT//8)  # 停止位置
+        self.bound = rng.randint(50, HEIGHT//8)  # 停止位置
         self.state = "down"  # 降下状態or停止状態
-        if tmr < 4500:#時間が90秒未満なら爆弾インターバルを短く
-            self.interval = random.randint(40, 45)  # 爆弾投下インターバルをランダムに指定する
-
-        if 4500 < tmr <= 9000: #時間が90秒から180秒なら爆弾インターバルを短く
-            self.interval =5
-
-    def three_Bombs(self,bird,tmr) -> list:
-        """
-        自機狙いをする弾と左右にランダムに動く弾を生成し返す。
-        引数:bird Birdインスタンス
-        戻り値:Bombインスタンスのリスト        
-        """
-        bombs =[Bomb(self,bird,tmr)] #自機を狙う
-        count =0
-        while count < random.randint(5,15):
-                    angle = random.uniform(-math.pi/3,math.pi/3) #ランダムに左右に弾を放つ
-                    vx = math.sin(angle) #
-                    vy = math.cos(angle) #
-                    norm = math.hypot(vx,vy)
-                    if norm == 0:
-                        continue #無効なベクトルをスキップ
-                    bombs.append(Bomb(self,bird,tmr,bullet=(vx/norm,vy/norm)))
-                    count +=1
-        # print(f"three_Bombs: 実際に返す弾の数 = {len(bombs)}") #ここで出てる弾の数を確認できる
+        lo, hi = (phase_at(tmr) or PHASES[-1])["interval"]  # 爆弾投下インターバルを攻撃形態から決める
+        self.interval = lo if lo == hi else rng.randint(lo, hi)
+
+    def volley(self, bird: Bird, tmr: int) -> list:
+        """
+        tmrのときの攻撃形態（patterns.PHASES）のエミッタの順に爆弾を生成し返す
+        引数1 bird：攻撃対象のこうかとん
+        引数2 tmr：経過ティック
+        戻り値：Bombインスタンスのリスト（攻撃形態がなければ空リスト）
+        """
+        phase = phase_at(tmr)
+        if phase is None:
+            return []
+        bombs = []
+        for em in phase["emitters"]:
+            lo, hi = em["count"]
+            if em.get("redraw"):  # 上限を引き直しながら，弾数が上限に届くまで足す（patterns.count_probs）
+                k = 0
+                while k < rng.randint(lo, hi):
+                    k += 1
+            else:
+                k = lo if lo == hi else rng.randint(lo, hi)
+            for _ in range(k):
+                if "spread" in em:  # 真下から±spread度の範囲にランダム
+                    angle = math.radians(rng.uniform(-em["spread"], em["spread"]))
+                    bullet = (math.sin(angle), math.cos(angle))
+                elif em.get("scatter") and rng.random() < em["scatter"]:  # scatterの確率でランダムな方向
+                    bullet = rng.choice(em["scatter_dirs"])
+                else:  # 自機狙い
+                    bullet = None
+                bombs.append(Bomb.spawn(self, bird, tmr, bullet))
         return bombs
 
+    def descent(self) -> int:
+        """
+        停止位置_boundを過ぎるまでに降下するティック数を返す
+        このティック数だけupdateで降下した次のティックにstopを呼ぶ（mainで予定しておく）
+        戻り値：降下するティック数
+        """
+        if self.rect.centery > self.bound:
+            return 0
+        return (self.bound-self.rect.centery)//self.vy+1
+
+    def stop(self):
+        """
+        _stateを停止状態に変更する
+        """
+        self.vy = 0
+        self.state = "stop"
+
     def update(self):
         """
         敵機を速度ベクトルself.vyに基づき移動（降下）させる
-        ランダムに決めた停止位置_boundまで降下したら，_stateを停止状態に変更する
-        引数 screen：画面Surface
+        停止位置で止めるのはdescentで予定したstopが行う
         """
-        if self.rect.centery > self.bound:
-            self.vy = 0
-            self.state = "stop"
         self.rect.move_ip(self.vx, self.vy)
 
 class Score:
@@ -307,7 +1203,7 @@ class Score:
         self.font = pg.font.Font(None, 50)
         self.color = (255, 0, 0)
         self.value = 3
-        self.image = self.font.render(f"Bomb: *\{self.value}/b*", 0, self.color)
+        self.image = texts.render(self.font, f"Bomb: *\{self.value}/b*", 0, self.color)
         self.rect = self.image.get_rect()
         self.rect.center = 500, HEIGHT-50
 
@@ -316,8 +1212,15 @@ class Score:
         必殺技の回数を変更する
         引数 screen：画面Surface
         """
-        self.image = self.font.render(f"Bomb: *\{self.value}/*", 0, self.color)
-        screen.blit(self.image, self.rect)
+        return screen.blit(self.render(), self.rect)
+
+    def render(self) -> pg.Surface:
+        """
+        必殺技の回数の表示を作り直す
+        戻り値：表示の画像
+        """
+        self.image = texts.render(self.font, f"Bomb: *\{self.value}/*", 0, self.color)
+        return self.image
 
 class hissatu(pg.sprite.Sprite):
     """
@@ -354,8 +1257,8 @@ class Time:
         """
         self.font = pg.font.Font(None, 50)
         self.color = (255, 255, 255)
-        self.value = 180
-        self.image = self.font.render(f"Time: {self.value}", 0, self.color)
+        self.value = PHASES[-1]["end"]//TICK_RATE  # 最後の攻撃形態が終わるまでの秒数
+        self.image = texts.render(self.font, f"Time: {self.value}", 0, self.color)
         self.rect = self.image.get_rect()
         self.rect.center = 300, HEIGHT-50
 
@@ -364,157 +1267,680 @@ class Time:
         残り時間の秒数を変更する
         引数 screen：画面Surface
         """
-        self.image = self.font.render(f"Time: {self.value}", 0, self.color)
-        screen.blit(self.image, self.rect)   
+        return screen.blit(self.render(), self.rect)
+
+    def render(self) -> pg.Surface:
+        """
+        残り時間の表示を作り直す
+        戻り値：表示の画像
+        """
+        self.image = texts.render(self.font, f"Time: {self.value}", 0, self.color)
+        return self.image
+
+
+def draw_group(group: pg.sprite.AbstractGroup, screen: pg.Surface) -> list[pg.Rect]:
+    """
+    Groupの全Spriteを描画し，描画した矩形のリストを返す
+    （pg.sprite.Group.drawは描画した矩形を返さないため，spritedictに記録された矩形を使う）
+    引数1 group：描画するGroup
+    引数2 screen：画面Surface
+    戻り値：描画した矩形のリスト
+    """
+    group.draw(screen)
+    return list(group.spritedict.values())
 
-bird = Bird(3, (300, 400))
-img1 = pg.Surface((WIDTH, HEIGHT))
-img1.set_alpha((180))
 
-def gameclear(screen: pg.Surface) -> None:
+class Snapshot:
+    """
+    1フレームの描画に必要な状態の写し
+    シミュレーションの状態から画像と描画位置の列を作っておき，描画はblitsだけで済ませる
+    画像は作り直さずに使い回すものだけを参照し，矩形と座標は写すので，写した後にシミュレーションを進めても変わらない
+    """
+    def __init__(self):
+        self.tmr = 0  # 写したティック
+        self.phase = ""  # 写したときの攻撃形態名
+        self.counts: dict[str, int] = {}  # 爆弾・爆発・敵機・必殺技の数（プロファイラに記録する）
+        self.gras: list[tuple[pg.Surface, pg.Rect]] = []  # 必殺技のエフェクト
+        self.bird: tuple[pg.Surface, pg.Rect, int] | None = None  # (画像, 矩形, 当たり判定の円の半径)
+        self.emys: list[tuple[pg.Surface, pg.Rect]] = []
+        self.sprites: list[tuple[pg.Surface, pg.Rect]] = []  # Spriteで管理する爆弾
+        self.bullets: list[tuple] = []  # Bulletsで管理する爆弾（bullet_batchesの戻り値）
+        self.exps: list[tuple[pg.Surface, tuple[int, int]]] = []
+        self.hud: list[tuple[pg.Surface, pg.Rect]] = []  # 必殺技の回数・残り時間
+
+    def capture(self, tmr: int, gras: pg.sprite.Group, bird: Bird, emys: pg.sprite.Group, bombs, exps: Explosions,
+                hud: list, phase: str = "", alpha: float = 1.0, overlay: bool = True, stride: int = 1):
         """
-        制限時間まで生き延びた場合にクリア画面を表示する
+        シミュレーションの状態を写す
+        引数1 tmr：現在のティック
+        引数2 gras：必殺技のGroup
+        引数3 bird：こうかとん
+        引数4 emys：敵機のGroup
+        引数5 bombs：爆弾（BulletsまたはBombGroup）
+        引数6 exps：爆発
+        引数7 hud：renderとrectを持つ表示（Score・Time）のリスト
+        引数8 phase：現在の攻撃形態名
+        引数9 alpha：補間係数（0：1ティック前の位置，1：現在の位置）
+        引数10 overlay：Falseなら必殺技のエフェクトを写さない
+        引数11 stride：爆発をstrideつおきに写す
+        """
+        self.tmr = tmr
+        self.phase = phase
+        self.counts = {"bombs": len(bombs), "exps": len(exps), "emys": len(emys), "gras": len(gras)}
+        self.gras = [(gra.image, gra.rect.copy()) for gra in gras] if overlay else []
+        self.bird = (bird.image, bird.pose(alpha).copy(), bird.hit_rad if bird.focus else 0)
+        self.emys = [(emy.image, emy.rect.copy()) for emy in emys]
+        if isinstance(bombs, Bullets):
+            self.sprites, self.bullets = [], bombs.batches(alpha)
+        else:
+            self.sprites, self.bullets = [(bomb.image, bomb.rect.copy()) for bomb in bombs], []
+        self.exps = exps.blits(stride)
+        self.hud = [(item.render(), item.rect.copy()) for item in hud]
+
+    def draw(self, screen: pg.Surface, doreturn: bool = True) -> list[pg.Rect]:
+        """
+        必殺技のエフェクト・こうかとん・敵機・爆弾・爆発を描画する
+        引数1 screen：画面Surface
+        引数2 doreturn：Falseなら描画した矩形を作らない（画面全体を描き直すとき）
+        戻り値：描画した矩形のリスト（doreturnがFalseなら空リスト）
+        """
+        rects = screen.blits(self.gras, doreturn) or []
+        if self.bird is not None:
+            rects.append(Bird.blit(screen, *self.bird))
+        rects += screen.blits(self.emys, doreturn) or []
+        rects += screen.blits(self.sprites, doreturn) or []
+        rects += blit_batches(screen, self.bullets, doreturn)
+        rects += screen.blits(self.exps, doreturn) or []
+        return rects if doreturn else []
+
+    def draw_hud(self, screen: pg.Surface) -> list[pg.Rect]:
+        """
+        必殺技の回数と残り時間を描画する
+        引数 screen：画面Surface
+        戻り値：描画した矩形のリスト
+        """
+        return screen.blits(self.hud)
+
+
+class DirtyRects:
+    """
+    画面全体を描き直す代わりに，前フレームと今フレームで描画した矩形だけを背景で消して画面に反映するクラス
+    """
+    def __init__(self, bg_img: pg.Surface, full_ratio: float = 0.5):
+        """
+        引数1 bg_img：背景画像Surface
+        引数2 full_ratio：更新する面積が画面のこの割合を超えたら画面全体を更新する
+        """
+        self.bg_img = bg_img
+        self.full_ratio = full_ratio
+        self.screen_rect = pg.Rect(0, 0, WIDTH, HEIGHT)
+        self.prev: list[pg.Rect] = []  # 前フレームで描画した矩形
+        self.cur: list[pg.Rect] = []  # 今フレームで描画した矩形
+        self.areas: list[int] = []  # フレームごとに更新したピクセル数
+
+    def clear(self, screen: pg.Surface):
+        """
+        前フレームで描画した矩形の下だけ背景を描き直す
         引数 screen：画面Surface
         """
-        pg.mixer.music.stop()
+        if self._area(self.prev) > self.full_ratio*WIDTH*HEIGHT:
+            screen.blit(self.bg_img, (0, 0))
+            return
+        screen.blits([(self.bg_img, r, r) for r in self.prev], doreturn=False)
+
+    def add(self, rects: "list[pg.Rect]|pg.Rect|None"):
+        """
+        今フレームで描画した矩形を記録する
+        引数 rects：描画した矩形（blitやdraw_groupなどの戻り値）
+        """
+        if rects is None:
+            return
+        if isinstance(rects, pg.Rect):
+            self.cur.append(rects.clip(self.screen_rect))
+        else:
+            self.cur.extend(r.clip(self.screen_rect) for r in rects)
+
+    def _area(self, rects: list[pg.Rect]) -> int:
+        return sum(r.w*r.h for r in rects)
+
+    def flush(self) -> int:
+        """
+        前フレームと今フレームの矩形だけを画面に反映する
+        戻り値：更新したピクセル数（矩形の面積の合計）
+        """
+        rects = self.prev+self.cur
+        area = self._area(rects)
+        if area > self.full_ratio*WIDTH*HEIGHT:
+            pg.display.update()
+            area = WIDTH*HEIGHT
+        else:
+            pg.display.update(rects)
+        self.prev, self.cur = self.cur, []
+        self.areas.append(area)
+        return area
+
+    def stats(self) -> dict:
+        """
+        更新したピクセル数の統計を返す
+        戻り値：フレーム数・1フレームあたりの平均と最大のピクセル数・画面全体に対する平均の割合の辞書
+        """
+        n = len(self.areas)
+        mean = sum(self.areas)/n if n else 0.0
+        return {
+            "frames": n,
+            "pixels_mean": mean,
+            "pixels_max": max(self.areas, default=0),
+            "ratio_mean": mean/(WIDTH*HEIGHT),
+        }
+
+
+def loading(screen: pg.Surface, loader: Preloader, fps: int = 60) -> float:
+    """
+    loaderの準備ができるまでロード画面（進み具合のバー）を描画する
+    引数1 screen：画面Surface
+    引数2 loader：読み込みを始めたPreloader
+    引数3 fps：ロード画面のフレームレート（0なら待たずに読み込み続ける）
+    戻り値：最初のロード画面を表示した時刻（time.perf_counter）
+    """
+    font = pg.font.Font(None, 40)
+    txt = font.render("Loading...", True, (255, 255, 255))
+    bar = pg.Rect(0, 0, WIDTH//2, 16)
+    bar.center = WIDTH//2, HEIGHT//2+30
+    clock = pg.time.Clock()
+    first = None
+    while True:
+        pg.event.pump()  # 閉じるボタンなどのイベントはゲーム開始後に処理する
+        screen.fill((0, 0, 0))
+        screen.blit(txt, txt.get_rect(center=(WIDTH//2, HEIGHT//2-10)))
+        pg.draw.rect(screen, (255, 255, 255), bar, 2)
+        pg.draw.rect(screen, (255, 255, 255), (bar.x, bar.y, round(bar.width*loader.progress), bar.height))
+        pg.display.update()
+        if first is None:
+            first = time.perf_counter()
+        if loader.poll(1/fps if fps else 0.05):
+            return first
+        if fps:
+            clock.tick(fps)
+
+
+def gameclear(screen: pg.Surface, wait: float = 4) -> None:
+        """
+        制限時間まで生き延びた場合にクリア画面を表示する
+        引数1 screen：画面Surface
+        引数2 wait：クリア画面の表示秒数（0なら待たない）
+        """
+        if pg.mixer.get_init():
+            pg.mixer.music.stop()
+        img1 = pg.Surface((WIDTH, HEIGHT))
+        img1.set_alpha(180)
         screen.blit(img1,(0, 0))  # ブラックアウト
-        pg.draw.rect(img1, (0, 0, 0), (0, 0, WIDTH, HEIGHT))
-        img2 =  pg.image.load("fig/9.png")
-        bird.change_img(9, screen)
+        img2 =  registry.image("fig/9.png")
+        Bird(3, (300, 400)).change_img(9, screen)
         fonto = pg.font.Font(None, 80)
-        txt = fonto.render("Game clear!", True, (255, 0, 0))
+        txt = texts.render(fonto, "Game clear!", True, (255, 0, 0))
         screen.blit(txt, [147, 250])  # テキストの表示
         screen.blit(img2, [280, 330])  # こうかとんの表示
         pg.display.update()
-        time.sleep(4)
+        if wait:
+            time.sleep(wait)
         return
 
-def main():
+@dataclass
+class GameConfig:
+    """
+    1ゲームの設定（mainに渡す）
+    """
+    headless: bool = False  # Trueなら画面・BGM・フレーム待ち・終了画面の待ち時間なしで全速力でシミュレーションする
+    seed: int | None = None  # 乱数シード（Noneなら固定しない）
+    invincible: bool = False  # Trueなら被弾してもゲームオーバーにせず最後までシミュレーションする
+    engine: str = "array"  # 爆弾の管理方法（"array"：Bulletsで一括処理，"lazy"：arrayのうち等速直線運動の爆弾は位置を発射時の状態から計算，
+                           # "sprite"：Bombを1個ずつSpriteで処理）
+    render: str = "full"  # 描画方法（"full"：毎フレーム画面全体を描き直す，"dirty"：変化した矩形だけ描き直す）
+    overlay: bool = False  # Trueなら処理段階ごとの所要時間を画面に重ねて表示する（F3キーで切り替え）
+    profile_out: str | None = None  # 処理段階ごとの所要時間を書き出すファイル（.jsonまたは.csv，Noneなら書き出さない）
+    fps: int = 50  # 描画の上限フレームレート（0以下なら上限なしで描画の質も変えない，シミュレーションはfpsによらず1秒TICK_RATEティックで進む）
+    max_catchup: int = 5  # 処理が遅れたとき1フレームで進める最大ティック数（超えた分は捨てる）
+    record: str | None = None  # 乱数シードとティックごとの入力を書き出すリプレイファイル（Noneなら書き出さない）
+    replay: str | None = None  # 再生するリプレイファイル（seedとengineとhitboxとceilingは記録の値を使い，記録の入力で進める）
+    hitbox: int = 6  # こうかとんの中心の当たり判定の円の半径（0なら従来どおり画像の矩形で判定する）
+    bot: object = None  # キー入力の代わりに入力ビットを返す関数bot(bird, bombs, tmr)（Noneならキー入力）
+    ceiling: int = 400  # 画面上の爆弾数の上限（近づくと発射を間引く，0なら無制限）
+    quality: str = "auto"  # 描画の質（"auto"：1フレームの処理時間に応じて自動で変える，"0"～"3"：段階を固定）
+    sim: str = "inline"  # シミュレーションの進め方（"inline"：描画と同じスレッドで順に進める，
+                         # "thread"：ワーカースレッドで次のフレームを進める間に前のフレームを描画する）
+
+    def __post_init__(self):
+        levels = [str(level) for level in range(len(QualityGovernor.levels))]
+        if self.quality != "auto" and self.quality not in levels:
+            raise ValueError(f"quality must be 'auto' or one of {levels}: {self.quality!r}")
+
+    @classmethod
+    def from_args(cls, args: argparse.Namespace) -> "GameConfig":
+        """
+        コマンドライン引数から設定を作る
+        引数 args：parse_argsの戻り値
+        戻り値：GameConfig
+        """
+        return cls(headless=args.headless, seed=args.seed, invincible=args.invincible, engine=args.engine,
+                   render=args.render, overlay=args.overlay, profile_out=args.profile, fps=args.fps,
+                   record=args.record, replay=args.replay, hitbox=args.hitbox, ceiling=args.ceiling,
+                   quality=args.quality, sim=args.sim)
+
+
+def main(config: GameConfig | None = None, **options) -> dict:
+    """
+    ゲームのメインループ
+    引数1 config：1ゲームの設定（Noneなら既定の設定）
+    引数2 options：configの一部を置き換える設定（main(headless=True, seed=0)のようにキーワードで渡す）
+    ヘッドレスのときは描画1フレームごとに1ティック進める
+    戻り値：シミュレーション結果の辞書
+      frames：シミュレーションしたティック数
+      survival_frame：最初に被弾したフレーム（被弾していなければNone）
+      cleared：制限時間まで生き延びたか
+      peak_bombs：画面上の爆弾数の最大値
+      wall_time：実時間（秒）
+      fps：1秒あたりのシミュレーションティック数
+      render_frames：描画したフレーム数
+      dropped_ticks：処理が追いつかず捨てたティック数
+      startup：起動からロード画面の表示まで（ttff）・読み込み完了まで（load）・ゲーム画面の最初の表示まで（tti）の秒数
+      phases：攻撃形態ごとの描画フレーム数と1フレームの平均所要時間（ミリ秒）
+      scheduler：予定した出来事の登録数・呼び出し回数・待っている数
+      input：キーのイベント数と，入力から画面の更新までの遅延（ミリ秒）のパーセンタイル
+      quality：描画の質の現在の段階・段階ごとのフレーム数・段階を変えた記録
+      pipeline：1フレームあたりのシミュレーション時間・メインスレッドの待ち時間・描画と並行できた時間（ミリ秒）
+      profile：処理段階ごとの所要時間（ミリ秒）の統計
+    """
+    config = replace(config or GameConfig(), **options)
+    headless, seed, invincible, engine = config.headless, config.seed, config.invincible, config.engine
+    render, overlay, profile_out, fps = config.render, config.overlay, config.profile_out, config.fps
+    max_catchup, record, replay, hitbox = config.max_catchup, config.record, config.replay, config.hitbox
+    bot, ceiling, quality, sim = config.bot, config.ceiling, config.quality, config.sim
+    rep = Replay.load(replay) if replay is not None else None
+    if rep is not None:
+        seed, engine, hitbox, ceiling = rep.seed, rep.engine, rep.hitbox, rep.ceiling
+    elif seed is None:
+        seed = random.randrange(2**32)  # 記録できるように必ずシードを決める
+    rng.seed(seed)
+    log = Replay(seed, engine, hitbox=hitbox, ceiling=ceiling)
+    launch = time.perf_counter()
     pg.display.set_caption("死ぬなこうかとん‼")
     screen = pg.display.set_mode((WIDTH, HEIGHT))
-    bg_img = pg.image.load(f"fig/bg_boss.jpg")
 
+    # 画像のデコードとBGMの読み込みはワーカースレッドで行い，その間ロード画面を表示する
     battle_BGM = f"fig/Eye-for-an-EyeT.wav"
-    with wave.open(battle_BGM,"rb") as f:
-        channels =f.getnchannels()
-        width = f.getsampwidth()
-        rate = f.getframerate()
-    pg.mixer.init(frequency=rate,size=-width*8,channels=channels)
-    pg.mixer.music.load(battle_BGM)
-    pg.mixer.music.play()
+    images = ["fig/bg_boss.jpg", "fig/3.png", "fig/6.png", "fig/8.png", "fig/9.png", "fig/beam.png",
+              "fig/explosion.gif", *sorted(set(Enemy.imgs))]
+    tasks = [Bomb.prerender, lambda: Bird(3, (300, 400))]  # 爆弾円とこうかとんの回転画像を作っておく
+    loader = Preloader(images, [] if headless else [battle_BGM], tasks).start()
+    first_frame = loading(screen, loader, 0 if headless else 60)
+    ready = time.perf_counter()
+
+    bg_img = registry.image("fig/bg_boss.jpg")
+    dirty = None
+    if render == "dirty":
+        screen.blit(bg_img, [0, 0])
+        pg.display.update()
+        dirty = DirtyRects(bg_img)
+
+    if not headless:
+        params, data = loader.sounds[battle_BGM]
+        pg.mixer.init(frequency=params.framerate, size=-params.sampwidth*8, channels=params.nchannels)
+        pg.mixer.music.load(data, "wav")
+        pg.mixer.music.play()
 
     get_time = Time()
 
     bird = Bird(3, (300, 400))
-    bombs = pg.sprite.Group()
-    exps = pg.sprite.Group()
+    bird.hit_rad = hitbox
+    budget = BulletBudget(ceiling)
+    if engine == "sprite":
+        bombs = BombGroup(budget=budget)
+    else:
+        bombs = Bullets(seed, budget=budget, lazy=engine == "lazy")
+    bullets = bombs if engine != "sprite" else None
+    exps = Explosions()
     emys = pg.sprite.Group()
     gras = pg.sprite.Group()
 
     score = Score()
 
     # ゲームオーバー画面
-    ck_img = pg.image.load("fig/8.png")  # 泣いているこうかとん画像
+    ck_img = registry.image("fig/8.png")  # 泣いているこうかとん画像
     bo_img = pg.Surface((WIDTH, HEIGHT))  # ブラックアウト画面
     pg.draw.rect(bo_img, (0,0,0),pg.Rect(0,0,WIDTH,HEIGHT))
     bo_img.set_alpha(170) 
     fonto = pg.font.Font(None,80)  # 文字
-    txt = fonto.render("Game Over",True, (255,255,255))
+    txt = texts.render(fonto, "Game Over",True, (255,255,255))
+    wait = 0 if headless else 3
 
+    def gameover(screen: pg.surface) -> None:
+        """
+        こうかとんが攻撃にヒットした場合にゲームオーバー画面を表示する
+        引数 screen：画面Surface
+        """
+        if pg.mixer.get_init():
+            pg.mixer.music.stop()
+        screen.blit(bo_img, [0, 0])
+        screen.blit(txt, [147,250])
+        screen.blit(ck_img,[280,330])
+        pg.display.update()
+        if wait:
+            time.sleep(wait)
+        return
 
-    # time = Time()
-    tmr = 0
-    clock = pg.time.Clock()
-    while True:
+    def result(survival_frame: int | None = None) -> dict:
+        """
+        シミュレーション結果を辞書にまとめる
+        引数 survival_frame：被弾したフレーム（被弾していなければNone）
+        """
+        pipe.close()
+        wall_time = time.perf_counter()-start
+        if profile_out is not None:
+            prof.dump(profile_out)
+        if record is not None:
+            log.save(record)
+        return {
+            "seed": seed,
+            "frames": tmr,
+            "survival_frame": survival_frame if survival_frame is not None else hit_frame,
+            "cleared": tmr >= PHASES[-1]["end"] and hit_frame is None,
+            "peak_bombs": peak_bombs,
+            "wall_time": wall_time,
+            "fps": tmr/wall_time if wall_time > 0 else 0.0,
+            "render_frames": frames,
+            "dropped_ticks": dropped,
+            "startup": {"ttff": first_frame-launch, "load": ready-launch, "tti": interactive},
+            "phases": {name: {"frames": n, "ms_mean": 1000*t/n} for name, (n, t) in phase_cost.items()},
+            "collision": bombs.hash.stats() if bullets is None else None,
+            "patterns": bullets.patterns.cost() if bullets is not None else None,
+            "assets": registry.stats(),
+            "text": texts.stats(),
+            "effects": exps.stats(),
+            "budget": budget.stats(len(bombs)),
+            "input": keys.stats(),
+            "quality": governor.stats(),
+            "scheduler": sched.stats(),
+            "pipeline": pipe.stats(),
+            "render": dirty.stats() if dirty is not None else {"frames": frames, "pixels_mean": WIDTH*HEIGHT,
+                                                                "pixels_max": WIDTH*HEIGHT, "ratio_mean": 1.0},
+            "profile": prof.summary(),
+        }
 
-        if tmr % 50 == 0:  #1秒ずつ減る
-            get_time.value-=1
+    # 時間で決まる出来事は起きるティックに予定しておき，期限が来たときだけ呼ぶ
+    sched = Scheduler()
+    falling = pg.sprite.Group()  # 停止位置まで降下中の敵機
+    phase_name = PHASES[0]["name"]  # 現在の攻撃形態名
 
-        if get_time.value <= 10 :
+    def countdown():
+        """
+        残り時間を1秒減らし，残り10秒になったら表示を赤くして5ティックごとに点滅させる
+        """
+        get_time.value -= 1
+        if get_time.value == 10:
             get_time.color = (255, 0, 0)
-            if tmr % 5 == 0:
-                get_time.color = (255, 255, 255)
-                
+            sched.at(-(-tmr//5)*5, blink, every=5)
 
+    def blink():
+        """
+        残り時間の表示を1ティックだけ白くする
+        """
+        if not governor.enabled("blink"):  # 描画の質を下げているときは赤のまま描き直さない
+            return
+        get_time.color = (255, 255, 255)
+        sched.at(tmr+1, setattr, get_time, "color", (255, 0, 0))
 
-        key_lst = pg.key.get_pressed()
-        for event in pg.event.get():
-            if event.type == pg.QUIT:
-                return 0
-            if event.type == pg.KEYDOWN and event.key == pg.K_b:
-                if score.value>0:
-                    gra = hissatu(50)
-                    gras.add(gra)
-                    score.value -= 1
-        screen.blit(bg_img, [0, 0])
+    def spawn_enemy():
+        """
+        敵機を出現させ，停止位置に着くティックに停止を予定する
+        """
+        emy = Enemy(tmr)
+        emys.add(emy)
+        falling.add(emy)
+        sched.at(tmr+emy.descent(), stop_enemy, emy, len(emys), stage="emys")
+
+    def stop_enemy(emy: Enemy, order: int):
+        """
+        敵機を停止させ，intervalごとの爆弾投下を予定する
+        引数1 emy：停止させる敵機
+        引数2 order：同じティックに爆弾投下する敵機の中での順番（出現順）
+        """
+        emy.stop()
+        falling.remove(emy)
+        sched.at((tmr//emy.interval+1)*emy.interval, volley, emy, every=emy.interval, order=order)
+
+    def volley(emy: Enemy):
+        """
+        停止した敵機から爆弾を投下する
+        引数 emy：爆弾を投下する敵機
+        """
+        if bullets is not None:
+            bullets.emit(emy, bird, tmr)  # 攻撃形態の表から一斉射撃
+            return
+        new = emy.volley(bird, tmr)  # 攻撃形態の表から一斉射撃
+        k = budget.allow(len(bombs), len(new))  # 爆弾数が上限に近ければ間引く
+        bombs.add(new[:k])
+        Bomb.pool.extend(new[k:])
+
+    def change_phase(phase: dict | None):
+        """
+        攻撃形態の切り替え（1フレームの所要時間を形態ごとに集計する）
+        引数 phase：次の攻撃形態の辞書（全形態が終わればNone）
+        """
+        nonlocal phase_name
+        phase_name = phase["name"] if phase is not None else "end"
 
-        if tmr%8000 == 0:
-            emys.add(Enemy(tmr))
+    sched.at(0, countdown, every=TICK_RATE)  # 1秒ずつ減る
+    sched.at(0, spawn_enemy, every=8000)
+    for prev, phase in zip(PHASES, PHASES[1:]+[None]):
+        sched.at(prev["end"]+1, change_phase, phase)
 
-        # if tmr%200 == 0 and tmr < 1500:  # 200フレームに1回，敵機を出現させる
-        #     emys.add(Enemy(tmr))
-        
-        # if tmr%100 ==0 and 1500 < tmr <= 3000: # 100フレームに1回，敵機を出現させる
-        #     emys.add(Enemy(tmr))
+    tmr = 0
+    peak_bombs = 0
+    hit_frame = None  # 無敵モードで最初に被弾したフレーム
+    frames = 0  # 描画したフレーム数
+    keys = KeyState(delay=0 if sim == "inline" else 1)  # キーのイベントから作る押下状態（Bキーはティックの区切りで発動させる）
+    keys.sync()
+    dropped = 0  # 処理が追いつかず捨てたティック数
+    phase_cost: dict[str, list] = {}  # 攻撃形態名 -> [描画フレーム数, 合計秒数]
+    interactive = None  # 起動からゲーム画面を最初に表示するまでの秒数
+    clock = pg.time.Clock()
+    governor = QualityGovernor(1000/fps if fps > 0 else None, fixed=None if quality == "auto" else int(quality))  # 描画の質
+    prof = FrameProfiler()
+    lap = prof.lap if sim == "inline" else lambda name: None  # ワーカースレッドでは処理段階を計らない
+
+    def advance(snap: Snapshot, steps: int, inputs: list[int] | None, alpha: float, effects: bool,
+                stride: int) -> str | None:
+        """
+        stepsティック分シミュレーションを進め，最新の状態をsnapに写す
+        引数1 snap：状態を写すSnapshot
+        引数2 steps：進めるティック数
+        引数3 inputs：ティックごとの入力ビット（Noneならリプレイかボットの入力で進める）
+        引数4 alpha：補間係数
+        引数5 effects：Falseなら必殺技のエフェクトを写さない
+        引数6 stride：爆発をstrideつおきに写す
+        戻り値：ゲームが終わったときの理由（"hit"：被弾，"clear"：制限時間まで生存，"end"：リプレイの終わり），続くならNone
+        """
+        nonlocal tmr, peak_bombs, hit_frame
+        for i in range(steps):
+            if inputs is not None:  # 直前までのイベントで決まった押下状態
+                bits = inputs[i]
+            elif rep is not None:  # リプレイの入力で進める
+                if tmr >= len(rep):
+                    return "end"
+                bits = rep.inputs[tmr]
+            else:  # ボットの入力で進める
+                bits = bot(bird, bombs, tmr)
+            key_lst, bomb = decode_keys(bits), bool(bits & BOMB_BIT)
+            log.record(bits)
+            if bomb and score.value>0:
+                gra = hissatu(50)
+                gras.add(gra)
+                sched.at(tmr+gra.life, gra.kill, stage="gras")  # 必殺技の終了
+                score.value -= 1
+
+            # カウントダウン・敵機の出現・一斉射撃・攻撃形態の切り替え
+            sched.run(tmr, "spawn")
+            peak_bombs = max(peak_bombs, len(bombs))
+            lap("spawn")
+
+            if bullets is not None and hitbox:
+                hits = bullets.collide_circle(bird.rect.center, hitbox)
+            elif bullets is not None:
+                hits = bullets.collide(bird.rect)
+            elif hitbox:
+                hits = bombs.hash.circlecollide(bird.rect.center, hitbox, True)
+            else:
+                hits = bombs.hash.spritecollide(bird, True)
+            for bomb in hits:  # こうかとんと衝突した爆弾リスト
+                if invincible:
+                    if hit_frame is None:
+                        hit_frame = tmr
+                    continue
+                tmr += 1
+                return "hit"
+
+            if bullets is not None:
+                exp_xys = [xy for gra in gras for xy in bullets.collide(gra.rect).tolist()]
+            else:
+                exp_xys = [bomb.rect.center for bomb in bombs.hash.groupcollide(gras, True).keys()]
+            if exp_xys:
+                exps.add(exp_xys, 50)
+                bird.change_img(6)
+            lap("collision")
+
+            sched.run(tmr, "gras")
+            lap("gras")
+            bird.move(key_lst)
+            lap("bird")
+            sched.run(tmr, "emys")  # 停止位置に着いた敵機を止める
+            falling.update()
+            lap("emys")
+            bombs.update(tmr)
+            lap("bombs")
+            exps.update()
+            lap("exps")
+            tmr += 1
 
-        for emy in emys:
-            if emy.state == "stop" and tmr%emy.interval == 0:
-                if 0 < tmr <= 4500:
-                    for b in emy.three_Bombs(bird,tmr):
-                        bombs.add(b)
-                else:
-                    bombs.add(Bomb(emy,bird,tmr))
-                # 敵機が停止状態に入ったら，intervalに応じて爆弾投下
+            if tmr == PHASES[-1]["end"]:  # 最後の攻撃形態が終わったら（残り0秒で）終了
+                return "clear"
+        snap.capture(tmr, gras, bird, emys, bombs, exps, [score, get_time], phase_name, alpha, effects, stride)
+        return None
 
+    # シミュレーションは描画する写しと書き込む写しを交互に使う（"thread"ならワーカースレッドで次のフレームを進める）
+    pipe = SimPipeline(advance, Snapshot(), Snapshot(), sim)
+    if pipe.pool is not None:  # 最初のフレームは開始時の状態を描画する
+        pipe.front.capture(tmr, gras, bird, emys, bombs, exps, [score, get_time], phase_name)
+    start = last = time.perf_counter()
+    acc = TICK  # 未処理の経過時間（最初のフレームで1ティック進める）
+    while True:
+        prof.start()
+        for event in pg.event.get():
+            if event.type == pg.QUIT:
+                return result()
+            if rep is None and bot is None:
+                keys.handle(event)
+            if event.type == pg.KEYDOWN and event.key == pg.K_F3:
+                overlay = not overlay
+        prof.lap("event")
 
-        for bomb in pg.sprite.spritecollide(bird, bombs, True):  # こうかとんと衝突した爆弾リスト
+        # 経過時間を固定長のティックに分けてシミュレーションを進める（ヘッドレスなら1フレーム1ティック）
+        if headless:
+            steps, alpha = 1, 1.0
+        else:
+            now = time.perf_counter()
+            acc += now-last
+            last = now
+            steps = int(acc/TICK)
+            if steps > max_catchup:  # 遅れを取り戻すのは最大max_catchupティックまで
+                dropped += steps-max_catchup
+                acc -= (steps-max_catchup)*TICK
+                steps = max_catchup
+            acc -= steps*TICK
+            alpha = acc/TICK
+        if not governor.enabled("interp"):
+            alpha = 1.0
+        inputs = [keys.sample() for _ in range(steps)] if rep is None and bot is None else None
+        status = pipe.advance(steps, inputs, alpha, governor.enabled("overlay"), 1 if governor.enabled("effects") else 2)
+        prof.lap("wait")
+        if status == "hit":
             gameover(screen)
             score.update(screen)
             pg.display.update()
-            return
-        
-        for bomb in pg.sprite.groupcollide(bombs, gras, True, False).keys():
-            exps.add(Explosion(bomb, 50))
-            bird.change_img(6, screen)
-
-        gras.update()
-        gras.draw(screen)
-        bird.update(key_lst, screen)
-        emys.update()
-        emys.draw(screen)
-        bombs.update(tmr)
-        bombs.draw(screen)
-        exps.update()
-        exps.draw(screen)
-        score.update(screen)
-        get_time.update(screen)  
-        pg.display.update()
-        tmr += 1
-        clock.tick(50)
+            return result(tmr-1)
+        if status == "clear":
+            gameclear(screen, 0 if headless else 4)
+            return result()
+        if status == "end":
+            return result()
 
-        if tmr == 9000:  #  0秒で終了
-            gameclear(screen)
-            return
-        
-        def gameover(screen: pg.surface) -> None:
-            """
-            こうかとんが攻撃にヒットした場合にゲームオーバー画面を表示する
-            引数 screen：画面Surface
-            """ 
-            pg.mixer.music.stop()
-            screen.blit(bo_img, [0, 0])
-            screen.blit(txt, [147,250])
-            screen.blit(ck_img,[280,330])
+        # 最新の写しを（爆弾とこうかとんは補間して）描画する
+        if dirty is None:
+            screen.blit(bg_img, [0, 0])
+        else:
+            dirty.clear(screen)
+        draw = dirty.add if dirty is not None else lambda rects: None
+        draw(pipe.front.draw(screen, dirty is not None))
+        prof.lap("draw")
+        draw(pipe.front.draw_hud(screen))
+        if overlay:
+            draw(prof.draw(screen))
+        prof.lap("hud")
+        if dirty is None:
             pg.display.update()
-            time.sleep(3)
-            return
-        
+        else:
+            dirty.flush()
+        keys.flipped()
+        frames += 1
+        if interactive is None:
+            interactive = time.perf_counter()-launch
+        snap = pipe.front  # "thread"ではワーカースレッドが状態を変えている最中なので，写しの値を記録する
+        prof.end(**snap.counts, rotozooms=registry.rotozooms, quality=governor.level)
+        cost = phase_cost.setdefault(snap.phase, [0, 0.0])
+        cost[0] += 1
+        cost[1] += prof.current["frame"]
+        clock.tick(0 if headless else max(fps, 0))
+        governor.update(clock.get_rawtime(), frames, snap.tmr)  # フレーム待ちを除いた処理時間で描画の質を決める
 
-        
+def run_headless(config: GameConfig | None = None, **options) -> dict:
+    """
+    ウィンドウ・音声なし（SDLダミードライバ）で1ゲームを全速力でシミュレーションする
+    引数1 config：1ゲームの設定（headlessは常にTrueにする，Noneなら既定の設定でseedは0）
+    引数2 options：configの一部を置き換える設定（キーワードで渡す）
+    戻り値：main関数の結果辞書
+    """
+    os.environ["SDL_VIDEODRIVER"] = "dummy"
+    os.environ["SDL_AUDIODRIVER"] = "dummy"
+    pg.init()
+    try:
+        return main(config or GameConfig(seed=0), **{**options, "headless": True})
+    finally:
+        pg.quit()
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="死ぬなこうかとん‼")
+    parser.add_argument("--headless", action="store_true", help="画面なし・全速力でシミュレーションし結果をJSONで出力する")
+    parser.add_argument("--seed", type=int, default=None, help="乱数シード")
+    parser.add_argument("--invincible", action="store_true", help="被弾しても最後までシミュレーションする（--headless用）")
+    parser.add_argument("--engine", choices=("array", "lazy", "sprite"), default="array", help="爆弾の管理方法（位置はどれも小数で持ち軌道は同じ，乱数の引き方が違うのでspriteは同じseedでも弾幕が変わる）")
+    parser.add_argument("--render", choices=("full", "dirty"), default="full", help="描画方法")
+    parser.add_argument("--fps", type=int, default=50, help="描画の上限フレームレート（0なら上限なし，シミュレーションは常に50ティック/秒）")
+    parser.add_argument("--overlay", action="store_true", help="処理段階ごとの所要時間を画面に重ねて表示する")
+    parser.add_argument("--profile", default=None, help="処理段階ごとの所要時間を書き出すファイル（.jsonまたは.csv）")
+    parser.add_argument("--hitbox", type=int, default=6, help="こうかとんの中心の当たり判定の円の半径（0なら画像の矩形で判定）")
+    parser.add_argument("--ceiling", type=int, default=400, help="画面上の爆弾数の上限（近づくと発射を間引く，0なら無制限）")
+    parser.add_argument("--record", default=None, help="乱数シードとティックごとの入力をリプレイファイルに書き出す")
+    parser.add_argument("--replay", default=None, help="リプレイファイルを再生する（--headlessなら描画なしで早送り）")
+    parser.add_argument("--quality", choices=("auto", "0", "1", "2", "3"), default="auto",
+                        help="描画の質（autoなら1フレームの処理時間に応じて自動で下げ・戻す，数字が大きいほど軽い）")
+    parser.add_argument("--sim", choices=SimPipeline.modes, default="inline",
+                        help="シミュレーションの進め方（threadならワーカースレッドで次のフレームを進める間に前のフレームを描画する）")
+    args = parser.parse_args()
+    config = GameConfig.from_args(args)
+    if args.headless:
+        print(json.dumps(run_headless(replace(config, seed=0 if args.seed is None else args.seed))))
+        sys.exit()
     pg.init()
-    main()
+    main(config)
     pg.quit()
     sys.exit()
@@ -0,0 +1,265 @@
+import numpy as np
+
+
+PHASES = [  # 攻撃形態の定義（endまでのティックがその形態．上から順に判定する）
+    {  # 第1形態（0～90秒）：自機狙い1発と，真下から左右60°以内にばらまく5～15発
+        "name": "phase1",
+        "end": 4500,
+        "interval": (40, 45),  # 敵機の爆弾投下インターバルの範囲（ティック）
+        "emitters": [
+            {"aim": True, "count": (1, 1)},  # 自機狙い
+            {"spread": 60, "count": (5, 15), "redraw": True},  # 真下から±spread度の範囲にランダム（redraw：弾数の分布，平均約7.9発）
+        ],
+        "rad": (13, 13),  # 爆弾の半径の範囲
+        "speed": 9,  # 発射時の速さ
+        "drift": None,  # ティックごとに選び直す速さの範囲（Noneなら一定）
+        "edge": "kill",  # 画面端での動き（"kill"：消滅，"reflect"：反射）
+        "life": None,  # 弾の寿命（ティック，Noneなら無制限）
+        "bounces": None,  # 弾が反射できる回数（Noneなら無制限）
+    },
+    {  # 第2形態（90～180秒）：1/4の確率で横・下向きのランダムな方向，それ以外は自機狙い
+        "name": "phase2",
+        "end": 9000,
+        "interval": (5, 5),
+        "emitters": [
+            {"aim": True, "count": (1, 1), "scatter": 0.25,
+             "scatter_dirs": [(-1, 0), (1, 0), (-1, 1), (0, 1), (1, 1)]},
+        ],
+        "rad": (5, 11),
+        "speed": 9,
+        "drift": (3, 8),
+        "edge": "reflect",
+        "life": 3000,
+        "bounces": 8,
+    },
+]
+NUM_OF_COLORS = 6  # 爆弾の色の数（Bomb.colorsの長さ）
+NO_LIMIT = 2**30  # 寿命・反射回数を制限しないときの値
+
+
+def phase_at(tmr: int, phases: list[dict] = PHASES) -> dict | None:
+    """
+    tmrのときの攻撃形態を返す
+    引数1 tmr：経過ティック
+    引数2 phases：攻撃形態の定義のリスト
+    戻り値：攻撃形態の辞書（全形態が終わっていればNone）
+    """
+    for phase in phases:
+        if tmr <= phase["end"]:
+            return phase
+    return None
+
+
+def count_probs(em: dict) -> tuple[np.ndarray, np.ndarray]:
+    """
+    エミッタの1回の一斉射撃の弾数の分布を返す
+    countの範囲から一様に選ぶ．redrawなら，1発足すたびに範囲から上限を引き直し，弾数が上限に届いたら止める
+    （元のthree_Bombsのwhile count < randint(5, 15)と同じ分布で，一様より少なくなる）
+    引数 em：エミッタの辞書
+    戻り値：弾数の配列と，それぞれの確率の配列のタプル
+    """
+    lo, hi = em["count"]
+    values = np.arange(lo, hi+1)
+    if not em.get("redraw"):
+        return values, np.full(len(values), 1/len(values))
+    go = (hi-values)/(hi-lo+1)  # 弾数kのとき，引き直した上限がkより大きくもう1発足す確率
+    reach = np.concatenate(([1.0], np.cumprod(go)[:-1]))  # 弾数kまで足し続ける確率
+    return values, reach*(1-go)
+
+
+def limits(phase: dict | None) -> tuple[int, int]:
+    """
+    攻撃形態の弾の寿命と反射できる回数を返す
+    引数 phase：攻撃形態の辞書（Noneなら制限なし）
+    戻り値：寿命（ティック）と反射できる回数のタプル（制限がなければNO_LIMIT）
+    """
+    if phase is None:
+        return NO_LIMIT, NO_LIMIT
+    life, bounces = phase.get("life"), phase.get("bounces")
+    return NO_LIMIT if life is None else life, NO_LIMIT if bounces is None else bounces
+
+
+def is_linear(phase: dict | None) -> bool:
+    """
+    攻撃形態の弾が等速直線運動をして，画面端で消えるまで消えないかを返す
+    このような弾は発射時に軌道と画面から出るティックが決まる（LinearBulletsで扱える）
+    引数 phase：攻撃形態の辞書
+    戻り値：速さの選び直し・反射・寿命がなく，画面端で消滅する形態ならTrue
+    """
+    return (phase is not None and phase["edge"] == "kill" and not phase["drift"]
+            and phase.get("life") is None and phase.get("bounces") is None)
+
+
+class BulletBudget:
+    """
+    画面上の弾数の上限（ceiling）を守るために発射数を間引くクラス
+    弾数がceilingのsoft倍を超えると，発射数を上限までの残りに比例して減らし，ceilingに達したら発射させない
+    間引きは端数を持ち越して決めるので乱数を使わない
+    """
+    def __init__(self, ceiling: int = 400, soft: float = 0.75):
+        """
+        引数1 ceiling：画面上の弾数の上限（0なら無制限）
+        引数2 soft：間引きを始める弾数のceilingに対する割合
+        """
+        self.ceiling = ceiling
+        self.soft = soft
+        self.credit = 0.0  # 持ち越した発射数の端数
+        self.spawned = 0  # 発射した弾の数
+        self.expired = 0  # 寿命・反射回数が尽きて消えた弾の数
+        self.throttled = 0  # 間引いた弾の数
+        self.peak = 0  # 画面上の弾数の最大値
+
+    def allow(self, live: int, k: int) -> int:
+        """
+        k発の一斉射撃のうち何発を発射してよいかを返す
+        引数1 live：画面上の弾数
+        引数2 k：発射しようとする弾の数
+        戻り値：発射してよい弾の数（一斉射撃の先頭から数える）
+        """
+        start = self.soft*self.ceiling
+        if not self.ceiling or live+k <= start:
+            n = k
+        else:
+            rate = min(1.0, max(0.0, (self.ceiling-live)/(self.ceiling-start)))
+            self.credit = min(self.credit+k*rate, k)
+            n = min(k, int(self.credit), max(0, self.ceiling-live))
+            self.credit -= n
+        self.spawned += n
+        self.throttled += k-n
+        self.peak = max(self.peak, live+n)
+        return n
+
+    def stats(self, live: int) -> dict:
+        """
+        弾数の管理状況を返す
+        引数 live：画面上の弾数
+        戻り値：上限・画面上の弾数とその最大値・発射数・消滅数・間引き数の辞書
+        """
+        return {
+            "ceiling": self.ceiling,
+            "live": live,
+            "peak": self.peak,
+            "spawned": self.spawned,
+            "expired": self.expired,
+            "throttled": self.throttled,
+        }
+
+
+class SpawnTable:
+    """
+    1つの攻撃形態の弾幕を前もって計算しておく表
+    batch回分の一斉射撃について，弾ごとの方向（自機狙いはNaN）・半径・色を連続した配列に並べて持つ
+    使い切ったら次のbatch回分をまとめて計算し直す
+    """
+    def __init__(self, phase: dict, rng: np.random.Generator, batch: int = 256):
+        """
+        引数1 phase：攻撃形態の辞書
+        引数2 rng：乱数生成器
+        引数3 batch：まとめて計算する一斉射撃の回数
+        """
+        self.phase = phase
+        self.rng = rng
+        self.batch = batch
+        self.compile()
+
+    def compile(self):
+        """
+        batch回分の一斉射撃を計算して表を作り直す
+        """
+        phase, rng, batch = self.phase, self.rng, self.batch
+        counts, dirs = [], []
+        for em in phase["emitters"]:
+            if em.get("redraw"):
+                values, p = count_probs(em)
+                k = rng.choice(values, batch, p=p)
+            else:
+                lo, hi = em["count"]
+                k = rng.integers(lo, hi+1, batch)
+            total = int(k.sum())
+            d = np.full((total, 2), np.nan)  # NaNは発射時に自機狙いの方向で埋める
+            if "spread" in em:
+                angle = np.radians(rng.uniform(-em["spread"], em["spread"], total))
+                d[:, 0], d[:, 1] = np.sin(angle), np.cos(angle)
+            elif em.get("scatter"):
+                choices = np.array(em["scatter_dirs"], dtype=float)
+                scatter = rng.random(total) < em["scatter"]
+                d[scatter] = choices[rng.integers(0, len(choices), int(scatter.sum()))]
+            counts.append(k)
+            dirs.append(np.split(d, np.cumsum(k)[:-1]))
+        # 一斉射撃ごとにエミッタの順に並べる
+        self.dirs = np.concatenate([d for volley in zip(*dirs) for d in volley])
+        per_volley = np.sum(counts, axis=0)
+        self.offsets = np.concatenate(([0], np.cumsum(per_volley)))
+        n = len(self.dirs)
+        self.rad = rng.integers(phase["rad"][0], phase["rad"][1]+1, n)
+        self.color = rng.integers(0, NUM_OF_COLORS, n)
+        self.cursor = 0
+
+    def next(self) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        次の一斉射撃の表を返す
+        戻り値：方向ベクトル（自機狙いはNaN）・半径・色の配列のタプル（方向は書き換えてよいコピー）
+        """
+        if self.cursor == self.batch:
+            self.compile()
+        sl = slice(self.offsets[self.cursor], self.offsets[self.cursor+1])
+        self.cursor += 1
+        return self.dirs[sl].copy(), self.rad[sl], self.color[sl]
+
+    def cost(self, tick_rate: int = 50) -> dict:
+        """
+        この攻撃形態の1機あたりの平均コストを返す
+        引数 tick_rate：1秒あたりのティック数
+        戻り値：1回の一斉射撃の平均弾数・1秒あたりの平均一斉射撃数と弾数の辞書
+        """
+        lo, hi = self.phase["interval"]
+        per_volley = len(self.dirs)/self.batch
+        volleys = tick_rate/((lo+hi)/2)
+        return {
+            "bullets_per_volley": per_volley,
+            "volleys_per_sec": volleys,
+            "bullets_per_sec": per_volley*volleys,
+        }
+
+
+class PatternEngine:
+    """
+    攻撃形態の定義（PHASES）から弾幕を生成するクラス
+    形態ごとのSpawnTableを前もって作っておくので，発射時には表を読み出して自機狙いの方向を埋めるだけでよい
+    """
+    def __init__(self, rng: np.random.Generator, phases: list[dict] = PHASES, batch: int = 256):
+        """
+        引数1 rng：乱数生成器
+        引数2 phases：攻撃形態の定義のリスト
+        引数3 batch：まとめて計算する一斉射撃の回数
+        """
+        self.phases = phases
+        self.tables = {phase["name"]: SpawnTable(phase, rng, batch) for phase in phases}
+
+    def phase(self, tmr: int) -> dict | None:
+        """
+        tmrのときの攻撃形態を返す（phase_atを参照）
+        """
+        return phase_at(tmr, self.phases)
+
+    def volley(self, tmr: int, aim: tuple[float, float]) -> tuple[np.ndarray, np.ndarray, np.ndarray, float] | None:
+        """
+        tmrのときの攻撃形態の一斉射撃を1回分返す
+        引数1 tmr：経過ティック
+        引数2 aim：自機狙いの方向ベクトル
+        戻り値：方向ベクトル・半径・色の配列と発射時の速さ・寿命・反射できる回数のタプル（攻撃形態がなければNone）
+        """
+        phase = self.phase(tmr)
+        if phase is None:
+            return None
+        dirs, rad, color = self.tables[phase["name"]].next()
+        dirs[np.isnan(dirs[:, 0])] = aim
+        return (dirs, rad, color, phase["speed"], *limits(phase))
+
+    def cost(self) -> dict:
+        """
+        攻撃形態ごとの平均コストを返す
+        戻り値：形態名 -> SpawnTable.costの辞書
+        """
+        return {name: table.cost() for name, table in self.tables.items()}
+
@@ -0,0 +1,86 @@
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+
+class SimPipeline:
+    """
+    シミュレーションを1フレーム分ずつ進め，描画に使う写しを2つ交互に使って（ダブルバッファ）メインスレッドに渡すクラス
+    "inline"：呼んだスレッドでそのまま進め，進めた直後の写しを描画する（従来どおりの決定的な順序）
+    "thread"：ワーカースレッドで次のフレームを進める間に，メインスレッドは前のフレームの写しを描画する
+    どちらの方法でもシミュレーションの順序と入力は同じなので，ゲームの進行（乱数・当たり判定・リプレイ）は変わらない
+    """
+    modes = ("inline", "thread")
+
+    def __init__(self, step, front, back, mode: str = "inline"):
+        """
+        引数1 step：step(snap, *args)でシミュレーションを進めて状態をsnapに写し，続くならNone，終わったら理由を返す関数
+        引数2 front：描画する写し
+        引数3 back：シミュレーションが書き込む写し
+        引数4 mode：進め方（"inline"または"thread"）
+        """
+        if mode not in __class__.modes:
+            raise ValueError(f"unknown mode: {mode}")
+        self.step = step
+        self.front = front
+        self.back = back
+        self.mode = mode
+        self.pool = ThreadPoolExecutor(1, thread_name_prefix="sim") if mode == "thread" else None
+        self.future: Future | None = None  # ワーカースレッドで進めているフレーム
+        self.frames = 0  # 進めたフレーム数
+        self.sim = 0.0  # シミュレーションと写しにかかった合計秒数
+        self.wait = 0.0  # メインスレッドがシミュレーションを待った合計秒数
+
+    def _run(self, args: tuple):
+        start = time.perf_counter()
+        status = self.step(self.back, *args)
+        return status, time.perf_counter()-start
+
+    def advance(self, *args):
+        """
+        1フレーム分シミュレーションを進め，描画する写し（front）を入れ替える
+        "thread"では前に始めたフレームを待って入れ替えてから，次のフレームをワーカースレッドで始める
+        引数 args：stepに渡す引数
+        戻り値：ゲームが終わったときの理由（続くならNone）
+        """
+        start = time.perf_counter()
+        if self.pool is None:
+            status, sim = self._run(args)
+        elif self.future is None:  # 最初のフレームは待つものがない
+            self.future = self.pool.submit(self._run, args)
+            return None
+        else:
+            status, sim = self.future.result()
+            self.future = None
+        self.wait += time.perf_counter()-start
+        self.sim += sim
+        self.frames += 1
+        if status is None:
+            self.front, self.back = self.back, self.front
+            if self.pool is not None:
+                self.future = self.pool.submit(self._run, args)
+        return status
+
+    def close(self):
+        """
+        進めているフレームを待ち，ワーカースレッドを終える
+        """
+        if self.pool is not None:
+            self.pool.shutdown(wait=True)
+            self.future = None
+
+    def stats(self) -> dict:
+        """
+        メインスレッドから外せた処理時間を返す
+        戻り値：進め方・フレーム数・1フレームあたりのシミュレーション時間・待ち時間・その差（描画と並行できた時間）の辞書（ミリ秒）
+        """
+        n = self.frames
+        sim = 1000*self.sim/n if n else 0.0
+        wait = 1000*self.wait/n if n else 0.0
+        return {
+            "mode": self.mode,
+            "frames": n,
+            "sim_ms_mean": sim,
+            "wait_ms_mean": wait,
+            "recovered_ms_mean": max(0.0, sim-wait),
+            "recovered_ratio": max(0.0, sim-wait)/sim if sim > 0 else 0.0,
+        }
@@ -0,0 +1,126 @@
+import csv
+import json
+import time
+from collections import deque
+import pygame as pg
+
+
+class FrameProfiler:
+    """
+    メインループの処理段階ごとの所要時間をリングバッファに記録するクラス
+    p50/p99と生存Sprite数を画面に重ねて表示したり，JSON/CSVに書き出したりできる
+    """
+    stages = ("event", "spawn", "collision", "gras", "bird", "emys", "bombs", "exps", "wait", "draw", "hud", "flip")
+
+    def __init__(self, size: int = 500, refresh: int = 25):
+        """
+        引数1 size：段階ごとに保持する直近のフレーム数
+        引数2 refresh：オーバーレイを描画し直す間隔（フレーム）
+        """
+        self.size = size
+        self.refresh = refresh
+        self.samples = {name: deque(maxlen=size) for name in __class__.stages+("frame",)}  # 秒
+        self.totals = {name: 0.0 for name in self.samples}  # ゲーム全体の合計秒数
+        self.current = dict.fromkeys(self.samples, 0.0)  # 計測中のフレームの段階ごとの秒数
+        self.counts: dict[str, int] = {}  # 直近フレームの生存Sprite数など
+        self.frames = 0
+        self.frame_start = self.last = time.perf_counter()
+        self.font = None
+        self.overlay: pg.Surface | None = None
+
+    def start(self):
+        """
+        フレームの計測を始める
+        """
+        self.frame_start = self.last = time.perf_counter()
+        for name in self.current:
+            self.current[name] = 0.0
+
+    def lap(self, name: str):
+        """
+        直前のlap（またはstart）からの経過時間を段階nameの所要時間として記録する
+        引数 name：段階名
+        """
+        now = time.perf_counter()
+        self.current[name] += now-self.last
+        self.last = now
+
+    def end(self, **counts: int):
+        """
+        フレームの計測を終え，段階ごとの所要時間をリングバッファに入れる
+        引数 counts：生存Sprite数など，フレームごとに記録する数
+        """
+        self.lap("flip")
+        self.current["frame"] = self.last-self.frame_start
+        for name, dt in self.current.items():
+            self.samples[name].append(dt)
+            self.totals[name] += dt
+        self.counts = counts
+        self.frames += 1
+
+    def percentile(self, name: str, q: float) -> float:
+        """
+        段階nameの直近の所要時間のq分位点をミリ秒で返す
+        引数1 name：段階名
+        引数2 q：0～1の分位
+        """
+        data = sorted(self.samples[name])
+        if not data:
+            return 0.0
+        return 1000*data[min(len(data)-1, int(q*len(data)))]
+
+    def summary(self) -> dict:
+        """
+        段階ごとのp50/p99/最大（直近sizeフレーム，ミリ秒）とゲーム全体の平均（ミリ秒）を返す
+        """
+        return {
+            name: {
+                "p50": self.percentile(name, 0.5),
+                "p99": self.percentile(name, 0.99),
+                "max": 1000*max(self.samples[name], default=0.0),
+                "mean": 1000*self.totals[name]/self.frames if self.frames else 0.0,
+            }
+            for name in self.samples
+        }
+
+    def draw(self, screen: pg.Surface) -> pg.Rect:
+        """
+        段階ごとのp50/p99と生存Sprite数を画面左上に重ねて表示する
+        引数 screen：画面Surface
+        戻り値：描画した矩形
+        """
+        if self.overlay is None or self.frames % self.refresh == 0:
+            if self.font is None:
+                self.font = pg.font.Font(None, 20)
+            lines = [f"{name:>9} {self.percentile(name, 0.5):6.2f} {self.percentile(name, 0.99):6.2f} ms"
+                     for name in self.samples]
+            lines += [f"{name:>9} {n}" for name, n in self.counts.items()]
+            line_h = self.font.get_linesize()
+            self.overlay = pg.Surface((190, line_h*len(lines)+4))
+            self.overlay.set_alpha(180)
+            for i, line in enumerate(lines):
+                self.overlay.blit(self.font.render(line, True, (255, 255, 255)), (4, 2+i*line_h))
+        return screen.blit(self.overlay, (0, 0))
+
+    def dump(self, path: str):
+        """
+        記録をファイルに書き出す（拡張子が.csvならフレームごとの表，それ以外はJSON）
+        引数 path：書き出すファイルのパス
+        """
+        if path.endswith(".csv"):
+            names = list(self.samples)
+            with open(path, "w", newline="") as f:
+                writer = csv.writer(f)
+                writer.writerow(["frame_no"]+[f"{name}_ms" for name in names])
+                rows = zip(*(self.samples[name] for name in names))
+                first = self.frames-len(self.samples["frame"])
+                for i, row in enumerate(rows):
+                    writer.writerow([first+i]+[f"{1000*dt:.4f}" for dt in row])
+            return
+        with open(path, "w") as f:
+            json.dump({
+                "frames": self.frames,
+                "summary": self.summary(),
+                "counts": self.counts,
+                "samples_ms": {name: [1000*dt for dt in self.samples[name]] for name in self.samples},
+            }, f, indent=2)
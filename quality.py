@@ -0,0 +1,92 @@
+class QualityGovernor:
+    """
+    1フレームの処理時間を予算と比べ，描画の質を段階的に下げたり戻したりするクラス
+    描画だけを軽くするので，ゲームの進行（当たり判定・乱数・リプレイ）は変わらない
+    処理時間の指数移動平均が予算のhigh倍を超えるフレームがdown_after回続いたら1段下げ，
+    low倍を下回るフレームがup_after回続いたら1段戻す（上げ下げの条件に差を付けて行き来し続けないようにする）
+    """
+    levels = ("full", "no_overlay", "thin_effects", "no_interp")  # 段階の名前（添字が大きいほど軽い）
+    features = {  # 描画の機能 -> その機能を省く段階
+        "overlay": 1,  # 必殺技の画面全体の半透明エフェクト
+        "blink": 1,  # 残り10秒の残り時間の点滅
+        "effects": 2,  # 爆発を全部描く（省くと1つおきに描く）
+        "interp": 3,  # 爆弾とこうかとんの位置の補間
+    }
+
+    def __init__(self, budget_ms: float | None = 20.0, high: float = 1.0, low: float = 0.6, down_after: int = 10,
+                 up_after: int = 120, smoothing: float = 0.1, fixed: int | None = None):
+        """
+        引数1 budget_ms：1フレームの処理時間の予算（ミリ秒，Noneなら予算がないので段階を変えない）
+        引数2 high：質を下げる処理時間の予算に対する割合
+        引数3 low：質を戻す処理時間の予算に対する割合
+        引数4 down_after：質を下げるまでに続けて予算を超えるフレーム数
+        引数5 up_after：質を戻すまでに続けて余裕のあるフレーム数
+        引数6 smoothing：処理時間の指数移動平均の係数
+        引数7 fixed：段階を固定する（Noneなら処理時間に応じて自動で変える）
+        """
+        if fixed is not None and not 0 <= fixed < len(__class__.levels):
+            raise ValueError(f"quality level must be 0-{len(__class__.levels)-1}: {fixed}")
+        self.budget_ms = budget_ms
+        self.high = high
+        self.low = low
+        self.down_after = down_after
+        self.up_after = up_after
+        self.smoothing = smoothing
+        self.fixed = fixed
+        self.level = 0 if fixed is None else fixed  # 現在の段階
+        self.ema = 0.0  # 処理時間の指数移動平均（ミリ秒）
+        self.over = 0  # 続けて予算を超えたフレーム数
+        self.under = 0  # 続けて余裕のあったフレーム数
+        self.frames = [0]*len(__class__.levels)  # 段階ごとのフレーム数
+        self.transitions: list[dict] = []  # 段階を変えた記録
+
+    @property
+    def name(self) -> str:
+        return __class__.levels[self.level]
+
+    def enabled(self, feature: str) -> bool:
+        """
+        現在の段階で描画の機能を使うかを返す
+        引数 feature：機能名（featuresのキー）
+        戻り値：使うならTrue
+        """
+        return self.level < __class__.features[feature]
+
+    def update(self, frame_ms: float, frame: int = 0, tmr: int = 0) -> int:
+        """
+        1フレームの処理時間を記録し，必要なら段階を変える
+        引数1 frame_ms：1フレームの処理時間（ミリ秒，clock.get_rawtime()など）
+        引数2 frame：描画したフレーム数（記録用）
+        引数3 tmr：経過ティック（記録用）
+        戻り値：現在の段階
+        """
+        self.frames[self.level] += 1
+        self.ema += self.smoothing*(frame_ms-self.ema)
+        if self.fixed is not None or self.budget_ms is None:
+            return self.level
+        self.over = self.over+1 if self.ema > self.high*self.budget_ms else 0
+        self.under = self.under+1 if self.ema < self.low*self.budget_ms else 0
+        if self.over >= self.down_after and self.level < len(__class__.levels)-1:
+            self._change(self.level+1, frame, tmr)
+        elif self.under >= self.up_after and self.level > 0:
+            self._change(self.level-1, frame, tmr)
+        return self.level
+
+    def _change(self, level: int, frame: int, tmr: int):
+        self.transitions.append({"frame": frame, "tmr": tmr, "from": self.name, "to": __class__.levels[level],
+                                 "ema_ms": round(self.ema, 3)})
+        self.level = level
+        self.over = self.under = 0
+
+    def stats(self) -> dict:
+        """
+        描画の質の変化を返す
+        戻り値：現在の段階・段階ごとのフレーム数・段階を変えた記録の辞書
+        """
+        return {
+            "level": self.level,
+            "name": self.name,
+            "budget_ms": self.budget_ms,
+            "frames": dict(zip(__class__.levels, self.frames)),
+            "transitions": self.transitions,
+        }
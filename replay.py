@@ -0,0 +1,98 @@
+import base64
+import json
+import zlib
+import pygame as pg
+
+
+KEY_BITS = {  # 記録するキーと入力ビットの対応
+    pg.K_UP: 1,
+    pg.K_DOWN: 2,
+    pg.K_LEFT: 4,
+    pg.K_RIGHT: 8,
+    pg.K_LSHIFT: 16,
+}
+BOMB_BIT = 32  # そのティックでBキー（必殺技）が押された
+
+
+def encode_keys(key_lst, bomb: bool = False) -> int:
+    """
+    押下キーの状態を1バイトの入力ビットにする
+    引数1 key_lst：押下キーの真理値リスト（pg.key.get_pressed()など）
+    引数2 bomb：そのティックでBキーが押されたか
+    戻り値：入力ビット
+    """
+    bits = BOMB_BIT if bomb else 0
+    for k, bit in KEY_BITS.items():
+        if key_lst[k]:
+            bits |= bit
+    return bits
+
+
+def decode_keys(bits: int) -> dict[int, bool]:
+    """
+    入力ビットを押下キーの真理値辞書に戻す（Bird.moveにkey_lstとして渡せる）
+    引数 bits：入力ビット
+    戻り値：キー -> 押下されているかの辞書
+    """
+    return {k: bool(bits & bit) for k, bit in KEY_BITS.items()}
+
+
+class Replay:
+    """
+    1ゲームを再現するための記録（乱数シード・ゲームの進行に影響する設定・ティックごとの入力ビット列）
+    """
+    version = 1
+
+    def __init__(self, seed: int, engine: str = "array", inputs: bytes = b"", hitbox: int = 0, ceiling: int = 0):
+        """
+        引数1 seed：乱数シード
+        引数2 engine：爆弾の管理方法（乱数の使い方が変わるので記録する）
+        引数3 inputs：ティックごとの入力ビット列
+        引数4 hitbox：こうかとんの当たり判定の円の半径（0なら画像の矩形）
+        引数5 ceiling：画面上の爆弾数の上限（0なら無制限）
+        """
+        self.seed = seed
+        self.engine = engine
+        self.hitbox = hitbox
+        self.ceiling = ceiling
+        self.inputs = bytearray(inputs)
+
+    def __len__(self) -> int:
+        return len(self.inputs)
+
+    def record(self, bits: int):
+        """
+        1ティック分の入力ビットを記録する
+        引数 bits：入力ビット
+        """
+        self.inputs.append(bits)
+
+    def save(self, path: str):
+        """
+        記録をJSONファイルに書き出す（入力ビット列はzlib圧縮してbase64にする）
+        引数 path：書き出すファイルのパス
+        """
+        with open(path, "w") as f:
+            json.dump({
+                "version": __class__.version,
+                "seed": self.seed,
+                "engine": self.engine,
+                "hitbox": self.hitbox,
+                "ceiling": self.ceiling,
+                "ticks": len(self.inputs),
+                "inputs": base64.b64encode(zlib.compress(bytes(self.inputs), 9)).decode("ascii"),
+            }, f)
+
+    @classmethod
+    def load(cls, path: str) -> "Replay":
+        """
+        saveで書き出した記録を読み込む
+        引数 path：記録ファイルのパス
+        戻り値：Replayインスタンス
+        """
+        with open(path) as f:
+            data = json.load(f)
+        if data.get("version") != cls.version:
+            raise ValueError(f"対応していないリプレイのバージョン: {data.get('version')}")
+        return cls(data["seed"], data["engine"], zlib.decompress(base64.b64decode(data["inputs"])), data.get("hitbox", 0),
+                   data.get("ceiling", 0))
@@ -0,0 +1,83 @@
+import heapq
+import itertools
+
+
+class Timer:
+    """
+    Schedulerに登録した1つの予定
+    """
+    __slots__ = ("due", "func", "args", "every", "order", "cancelled")
+
+    def __init__(self, due: int, func, args: tuple, every: int, order: int):
+        self.due = due  # 次に呼ぶティック
+        self.func = func
+        self.args = args
+        self.every = every  # 繰り返す間隔（ティック，0なら1回だけ）
+        self.order = order  # 同じティックの予定を呼ぶ順（小さいほど先）
+        self.cancelled = False
+
+    def cancel(self):
+        """
+        予定を取り消す（呼ばれる前ならもう呼ばれず，繰り返しの予定なら以後呼ばれない）
+        """
+        self.cancelled = True
+
+
+class Scheduler:
+    """
+    ティックを単位に予定した処理を，期限が来たときだけ呼ぶクラス
+    予定は段階（メインループの処理段階名）ごとのヒープに(ティック, order, 登録順)の順で並べるので，
+    毎ティックの処理は各段階のヒープの先頭を見るだけで済み，予定の数によらない
+    """
+    def __init__(self):
+        self.queues: dict[str, list] = {}  # 段階名 -> (ティック, order, 登録順, Timer)のヒープ
+        self.seq = itertools.count()  # 同じティック・orderの予定は登録順に呼ぶ
+        self.scheduled = 0  # 登録した予定の数
+        self.fired = 0  # 呼んだ回数
+
+    def at(self, tick: int, func, *args, stage: str = "spawn", every: int = 0, order: int = 0) -> Timer:
+        """
+        tickのstage段階でfunc(*args)を呼ぶ予定を登録する
+        引数1 tick：呼ぶティック
+        引数2 func：呼ぶ関数
+        引数3 args：funcに渡す引数
+        引数4 stage：呼ぶ処理段階名（runに渡す名前）
+        引数5 every：0より大きければ，その後everyティックごとに繰り返し呼ぶ
+        引数6 order：同じティック・段階の予定を呼ぶ順（小さいほど先）
+        戻り値：取り消しに使うTimer
+        """
+        timer = Timer(tick, func, args, every, order)
+        self._push(stage, timer)
+        self.scheduled += 1
+        return timer
+
+    def _push(self, stage: str, timer: Timer):
+        heapq.heappush(self.queues.setdefault(stage, []), (timer.due, timer.order, next(self.seq), timer))
+
+    def run(self, tick: int, stage: str):
+        """
+        stage段階の予定のうち，tickまでに期限が来たものを順に呼ぶ
+        呼んでいる間に登録された同じティックの予定も続けて呼ぶ
+        引数1 tick：現在のティック
+        引数2 stage：処理段階名
+        """
+        queue = self.queues.get(stage)
+        while queue and queue[0][0] <= tick:
+            timer = heapq.heappop(queue)[3]
+            if timer.cancelled:
+                continue
+            timer.func(*timer.args)
+            self.fired += 1
+            if timer.every and not timer.cancelled:
+                timer.due += timer.every
+                self._push(stage, timer)
+
+    def __len__(self) -> int:
+        return sum(1 for queue in self.queues.values() for *_, timer in queue if not timer.cancelled)
+
+    def stats(self) -> dict:
+        """
+        予定の登録・呼び出し状況を返す
+        戻り値：登録数・呼び出し回数・待っている予定の数の辞書
+        """
+        return {"scheduled": self.scheduled, "fired": self.fired, "pending": len(self)}
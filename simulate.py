@@ -0,0 +1,254 @@
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")  # pygameの挨拶文を集計の出力に混ぜない
+import musou_kokaton
+from musou_kokaton import HEIGHT, WIDTH
+from patterns import PHASES
+from replay import BOMB_BIT
+
+
+UP, DOWN, LEFT, RIGHT, SLOW = 1, 2, 4, 8, 16  # replay.KEY_BITSの入力ビット
+MOVES = [  # ボットが選べる移動（入力ビット, 1ティックの移動量）
+    (bits | slow, (dx*speed, dy*speed))
+    for slow, speed in ((0, 10), (SLOW, 3))
+    for bits, dx, dy in (
+        (0, 0, 0), (UP, 0, -1), (DOWN, 0, 1), (LEFT, -1, 0), (RIGHT, 1, 0),
+        (UP | LEFT, -1, -1), (UP | RIGHT, 1, -1), (DOWN | LEFT, -1, 1), (DOWN | RIGHT, 1, 1),
+    )
+    if slow == 0 or bits != 0
+]
+MAX_TICKS = PHASES[-1]["end"]  # 1ゲームのティック数（最後の攻撃形態まで生き延びたらクリア）
+
+
+def threats(bombs) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    爆弾の中心座標・1ティックの移動量・半径を配列で返す
+    引数 bombs：Bulletsまたは爆弾のGroup
+    戻り値：中心座標(n, 2)・移動量(n, 2)・半径(n,)の配列のタプル
+    """
+    if hasattr(bombs, "kinematics"):  # Bullets
+        return bombs.kinematics()
+    sprites = bombs.sprites()
+    if not sprites:
+        return np.zeros((0, 2)), np.zeros((0, 2)), np.zeros(0)
+    pos = np.array([b.rect.center for b in sprites], dtype=float)
+    vel = np.array([(b.vx*b.speed, b.vy*b.speed) for b in sprites], dtype=float)
+    rad = np.array([b.rad for b in sprites], dtype=float)
+    return pos, vel, rad
+
+
+class IdleBot:
+    """
+    何も入力しないボット（弾幕そのものの当たりやすさの基準）
+    """
+    def __init__(self, seed: int):
+        pass
+
+    def __call__(self, bird, bombs, tmr: int) -> int:
+        return 0
+
+
+class RandomBot:
+    """
+    一定間隔でランダムに移動方向を選び直すボット
+    """
+    def __init__(self, seed: int, hold: int = 10):
+        """
+        引数1 seed：乱数シード
+        引数2 hold：同じ方向に動き続けるティック数
+        """
+        self.rng = random.Random(seed)
+        self.hold = hold
+        self.bits = 0
+
+    def __call__(self, bird, bombs, tmr: int) -> int:
+        if tmr % self.hold == 0:
+            self.bits = self.rng.choice(MOVES)[0]
+        return self.bits
+
+
+class DodgeBot:
+    """
+    爆弾が等速で進むと仮定して数ティック先まで予測し，爆弾との隙間が最も大きくなる移動を選ぶボット
+    どの移動でも避けられないときは必殺技を使う
+    """
+    def __init__(self, seed: int, horizon: int = 24, home: tuple[int, int] = (300, 550), bombs: int = 3):
+        """
+        引数1 seed：乱数シード（同点の移動を選ぶのに使う）
+        引数2 horizon：予測するティック数
+        引数3 home：爆弾が近くにないときに戻る位置
+        引数4 bombs：使える必殺技の回数
+        """
+        self.rng = np.random.default_rng(seed)
+        self.horizon = horizon
+        self.home = np.array(home, dtype=float)
+        self.bombs = bombs
+        self.bits = np.array([bits for bits, _ in MOVES])
+        self.delta = np.array([d for _, d in MOVES], dtype=float)
+        self.steps = np.arange(1, horizon+1, dtype=float)
+
+    def __call__(self, bird, bombs, tmr: int) -> int:
+        w, h = bird.rect.width/2, bird.rect.height/2
+        center = np.array(bird.rect.center, dtype=float)
+        # 移動ごと・ティックごとのこうかとんの中心 (移動, ティック, 2)
+        me = center+self.delta[:, None, :]*self.steps[None, :, None]
+        np.clip(me[..., 0], w, WIDTH-w, out=me[..., 0])
+        np.clip(me[..., 1], h, HEIGHT-h, out=me[..., 1])
+        score = -0.01*np.hypot(*(me[:, -1]-self.home).T)  # 何もなければ定位置に戻る
+        pos, vel, rad = threats(bombs)
+        if len(pos):
+            # ティックごとの爆弾の中心 (爆弾, ティック, 2)
+            them = pos[:, None, :]+vel[:, None, :]*self.steps[None, :, None]
+            gap = np.hypot(*(me[:, None]-them[None]).transpose(3, 0, 1, 2))-rad[None, :, None]-(bird.hit_rad or w)
+            clearance = gap.min(axis=(1, 2))
+            score += np.minimum(clearance, 60)
+            if clearance.max() < 0 and self.bombs > 0:
+                self.bombs -= 1
+                return BOMB_BIT
+        best = np.flatnonzero(score >= score.max()-1e-9)
+        return int(self.bits[self.rng.choice(best)])
+
+
+POLICIES = {"idle": IdleBot, "random": RandomBot, "dodge": DodgeBot}
+
+
+def _init_worker():
+    """
+    ワーカープロセスでpygameをウィンドウ・音声なしで初期化する
+    """
+    os.environ["SDL_VIDEODRIVER"] = "dummy"
+    os.environ["SDL_AUDIODRIVER"] = "dummy"
+    import pygame as pg
+    pg.init()
+
+
+def play(seed: int, policy: str, engine: str = "array", hitbox: int = 6, ceiling: int = 400) -> dict:
+    """
+    ボットで1ゲームをヘッドレスで遊び，結果を返す（ワーカープロセスで呼ばれる）
+    引数1 seed：乱数シード
+    引数2 policy：ボットの名前（POLICIESのキー）
+    引数3 engine：爆弾の管理方法
+    引数4 hitbox：こうかとんの当たり判定の円の半径
+    引数5 ceiling：画面上の爆弾数の上限（0なら無制限）
+    戻り値：main関数の結果辞書の一部
+    """
+    res = musou_kokaton.main(headless=True, seed=seed, engine=engine, hitbox=hitbox, bot=POLICIES[policy](seed),
+                             ceiling=ceiling)
+    survival = res["survival_frame"]
+    return {
+        "seed": seed,
+        "policy": policy,
+        "survival": MAX_TICKS if survival is None else survival,
+        "cleared": res["cleared"],
+        "peak_bombs": res["peak_bombs"],
+        "phases": res["phases"],
+        "budget": res["budget"],
+    }
+
+
+def histogram(values: list[int], bins: int, hi: int = MAX_TICKS) -> list[int]:
+    """
+    0～hiをbins等分した度数分布を返す（hi以上は最後の区間に入れる）
+    """
+    counts = [0]*bins
+    for v in values:
+        counts[min(bins-1, v*bins//hi)] += 1
+    return counts
+
+
+def aggregate(runs: list[dict], bins: int) -> dict:
+    """
+    ボットごとに生存ティックの分布・爆弾数の最大値・攻撃形態ごとの1フレームの所要時間をまとめる
+    引数1 runs：playの結果のリスト
+    引数2 bins：生存ティックの度数分布の区間数
+    戻り値：ボット名 -> 集計結果の辞書
+    """
+    report = {}
+    for policy in sorted({r["policy"] for r in runs}):
+        rs = [r for r in runs if r["policy"] == policy]
+        survival = np.array([r["survival"] for r in rs])
+        peak = np.array([r["peak_bombs"] for r in rs])
+        phases: dict[str, list] = {}
+        for r in rs:
+            for name, ph in r["phases"].items():
+                acc = phases.setdefault(name, [0, 0.0])
+                acc[0] += ph["frames"]
+                acc[1] += ph["frames"]*ph["ms_mean"]
+        report[policy] = {
+            "games": len(rs),
+            "cleared": sum(r["cleared"] for r in rs)/len(rs),
+            "survival": {
+                "mean": float(survival.mean()),
+                "p10": float(np.percentile(survival, 10)),
+                "p50": float(np.percentile(survival, 50)),
+                "p90": float(np.percentile(survival, 90)),
+                "histogram": histogram(survival.tolist(), bins),
+            },
+            "peak_bombs": {"mean": float(peak.mean()), "max": int(peak.max())},
+            "phases": {name: {"frames": n, "ms_mean": t/n} for name, (n, t) in phases.items()},
+        }
+    return report
+
+
+def print_report(report: dict, bins: int, out=sys.stdout):
+    """
+    集計結果を表と文字のヒストグラムで表示する
+    """
+    width = MAX_TICKS//bins
+    for policy, rep in report.items():
+        sv = rep["survival"]
+        print(f"[{policy}] games={rep['games']} cleared={100*rep['cleared']:.1f}% "
+              f"survival mean={sv['mean']:.0f} p10={sv['p10']:.0f} p50={sv['p50']:.0f} p90={sv['p90']:.0f} "
+              f"peak_bombs mean={rep['peak_bombs']['mean']:.1f} max={rep['peak_bombs']['max']}", file=out)
+        top = max(sv["histogram"]) or 1
+        for i, n in enumerate(sv["histogram"]):
+            print(f"  {i*width:5d}-{(i+1)*width-1:5d} {n:6d} {'#'*(40*n//top)}", file=out)
+        for name, ph in rep["phases"].items():
+            print(f"  {name:>8} frames={ph['frames']} {ph['ms_mean']:.3f} ms/frame", file=out)
+
+
+def main(argv: list[str] | None = None) -> dict:
+    """
+    多数のゲームをプロセスプールで並列にヘッドレス実行して集計する
+    引数 argv：コマンドライン引数（Noneならsys.argv）
+    戻り値：ボット名 -> 集計結果の辞書
+    """
+    parser = argparse.ArgumentParser(description="ボットで多数のゲームを並列にシミュレーションして難易度と処理負荷を集計する")
+    parser.add_argument("--games", type=int, default=100, help="ボットごとのゲーム数")
+    parser.add_argument("--seed", type=int, default=0, help="最初のゲームの乱数シード（ゲームごとに1ずつ増やす）")
+    parser.add_argument("--policy", nargs="+", choices=sorted(POLICIES), default=["dodge"], help="ボットの種類")
+    parser.add_argument("--engine", choices=("array", "lazy", "sprite"), default="array", help="爆弾の管理方法")
+    parser.add_argument("--hitbox", type=int, default=6, help="こうかとんの中心の当たり判定の円の半径")
+    parser.add_argument("--ceiling", type=int, default=400, help="画面上の爆弾数の上限（0なら無制限）")
+    parser.add_argument("--workers", type=int, default=None, help="ワーカープロセス数（既定はCPU数）")
+    parser.add_argument("--bins", type=int, default=10, help="生存ティックのヒストグラムの区間数")
+    parser.add_argument("--out", default=None, help="集計結果と全ゲームの結果を書き出すJSONファイル")
+    args = parser.parse_args(argv)
+
+    jobs = [(args.seed+i, policy) for policy in args.policy for i in range(args.games)]
+    runs = []
+    start = time.perf_counter()
+    with ProcessPoolExecutor(args.workers, initializer=_init_worker) as pool:
+        futures = [pool.submit(play, seed, policy, args.engine, args.hitbox, args.ceiling) for seed, policy in jobs]
+        for i, fut in enumerate(as_completed(futures), 1):
+            runs.append(fut.result())
+            print(f"\r{i}/{len(jobs)} games", end="", file=sys.stderr)
+    print(f"\r{len(jobs)} games in {time.perf_counter()-start:.1f} s", file=sys.stderr)
+    runs.sort(key=lambda r: (r["policy"], r["seed"]))
+    report = aggregate(runs, args.bins)
+    print_report(report, args.bins)
+    if args.out is not None:
+        with open(args.out, "w") as f:
+            json.dump({"args": vars(args), "report": report, "runs": runs}, f, indent=2)
+    return report
+
+
+if __name__ == "__main__":
+    main()